@@ -0,0 +1,54 @@
+"""
+Pluggable JSON decoding for trace lines. Uses orjson or simdjson if installed, and
+falls back to the json module of the stdlib otherwise.
+
+The clients emit one json object per executed opcode, so the decoder is the hot
+path when canonicalizing long traces.
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _orjson():
+    import orjson
+    return orjson.loads
+
+def _simdjson():
+    import simdjson
+    return simdjson.loads
+
+def _stdlib():
+    decode = json.loads
+    def loads(s):
+        # json.loads sniffs the encoding of bytes in python, utf-8 is cheaper
+        if type(s) is bytes:
+            s = s.decode()
+        return decode(s)
+    return loads
+
+backends = {
+    "orjson": _orjson,
+    "simdjson": _simdjson,
+    "json": _stdlib,
+}
+
+backend = None
+loads = None
+
+def use(name=None):
+    """ Selects the json backend by name. If no name is given, the fastest available
+    backend is used. Returns the name of the selected backend """
+    global backend, loads
+    names = [name] if name else ["orjson", "simdjson", "json"]
+    for n in names:
+        try:
+            loads = backends[n]()
+            backend = n
+            return n
+        except ImportError:
+            if name:
+                raise
+    return backend
+
+use()
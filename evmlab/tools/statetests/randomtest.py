@@ -49,6 +49,23 @@ def process_template(d):
     return d
 
 
+def materialize(d):
+    """ Returns a copy of d with every rndval object replaced by a generated value, in one walk.
+    The same as a json round-trip through RandomTestsJsonEncoder, the values are generated in the
+    same order
+    """
+    t = type(d)
+    if t is str:
+        return d
+    if t is dict:
+        return {k: materialize(v) for k, v in d.items()}
+    if t is list or t is tuple:
+        return [materialize(v) for v in d]
+    if isinstance(d, rndval._RndBase):
+        return materialize(d.generate())
+    return d
+
+
 class RandomTestsJsonEncoder(json.JSONEncoder):
     """ Custom JSONEncoder to encode rndval objects to str """
     def default(self, obj):
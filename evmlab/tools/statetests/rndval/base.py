@@ -1,10 +1,13 @@
 import random
 import binascii
+import bisect
+import contextlib
 
 
 class WeightedRandomizer(object):
     # https://stackoverflow.com/a/14993631/1729555
-    def __init__(self, weights):
+    def __init__(self, weights, rng=None):
+        self._rng = rng
         self.__max = .0
         self.__weights = []
         for value, weight in weights.items():
@@ -13,15 +16,38 @@ class WeightedRandomizer(object):
                 continue
             self.__max += weight
             self.__weights.append((self.__max, value))
+        self._cum_weights = [ceil for ceil, value in self.__weights]
+        self._values = [value for ceil, value in self.__weights]
+
+    @property
+    def rng(self):
+        return self._rng if self._rng is not None else random
 
     def random(self):
         if len(self.__weights) == 1:
             return self.__weights[0][1]  # shortcut: return value
 
-        r = random.random() * self.__max
-        for ceil, value in self.__weights:
-            if ceil > r:
-                return value
+        # the first value with a cumulative weight above r
+        r = self.rng.random() * self.__max
+        return self._values[min(bisect.bisect_right(self._cum_weights, r), len(self._values) - 1)]
+
+    def sample(self, n):
+        """ Returns a list of n values, drawn at once """
+        if len(self._values) == 1:
+            return self._values * max(n, 0)
+        return self.rng.choices(self._values, cum_weights=self._cum_weights, k=n)
+
+
+@contextlib.contextmanager
+def seeded_random(rng):
+    """ Seeds the random module from rng for the duration, for the generators drawing from it
+    (evmcodegen, evmdasm), and restores its state afterwards """
+    state = random.getstate()
+    random.seed(rng.getrandbits(64))
+    try:
+        yield
+    finally:
+        random.setstate(state)
 
 
 def toCompactHex(int):
@@ -49,9 +75,16 @@ class _RndBase(object):
 
     QUOTE = "'"
 
-    def __init__(self, seed=None, _config=None):
+    def __init__(self, seed=None, _config=None, rng=None):
         self.seed = seed
         self._config = _config
+        # The random.Random the values are drawn from (see StateTestTemplate.fill)
+        self._rng = rng
+
+    @property
+    def rng(self):
+        # The random module, unless given an instance. Not stored, so the generators can be copied
+        return self._rng if self._rng is not None else random
 
     def __str__(self):
         # for json serialization
@@ -69,10 +102,13 @@ class _RndBase(object):
         max = max or 2**64-1
         assert(min <= max)
         # numpy.random.randint
-        return min + random.randint(min, max) % (max-min)  # uniIntDist 0..0x7fffffff
+        return min + self.rng.randint(min, max) % (max-min)  # uniIntDist 0..0x7fffffff
 
     def randomByteSequence(self, length):
-        return bytearray(random.getrandbits(8) for _ in range(length))
+        if length <= 0:
+            return bytearray()
+        # drawn at once, as random.randbytes does
+        return bytearray(self.rng.getrandbits(8 * length).to_bytes(length, "little"))
 
     def randomPercent(self):
         return self.randomUniInt(0,100)  ## percentDist 0..100 percent
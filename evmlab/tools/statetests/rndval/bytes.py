@@ -8,8 +8,8 @@ class RndByteSequence(_RndBase):
     """
     placeholder = "[BYTES]"
 
-    def __init__(self, seed=None, length=None, prefix=""):
-        super().__init__(seed=seed)
+    def __init__(self, seed=None, length=None, prefix="", rng=None):
+        super().__init__(seed=seed, rng=rng)
         assert(length > 0)
         self.length = length
         self.prefix = prefix
@@ -27,8 +27,8 @@ class RndHash20(RndByteSequence):
     """
     placeholder = "[HASH20]"
 
-    def __init__(self, seed=None, length=20, prefix=""):
-        super().__init__(seed=seed, length=length, prefix=prefix)
+    def __init__(self, seed=None, length=20, prefix="", rng=None):
+        super().__init__(seed=seed, length=length, prefix=prefix, rng=rng)
 
 
 class RndHash32(RndByteSequence):
@@ -37,8 +37,8 @@ class RndHash32(RndByteSequence):
     """
     placeholder = "[HASH32]"
 
-    def __init__(self, seed=None, length=32, prefix=""):
-        super().__init__(seed=seed, length=length, prefix=prefix)
+    def __init__(self, seed=None, length=32, prefix="", rng=None):
+        super().__init__(seed=seed, length=length, prefix=prefix, rng=rng)
 
 
 class Rnd0xHash32(RndByteSequence):
@@ -47,8 +47,8 @@ class Rnd0xHash32(RndByteSequence):
     """
     placeholder = "[0xHASH32]"
 
-    def __init__(self, seed=None, length=32, prefix="0x"):
-        super().__init__(seed=seed, length=length, prefix=prefix)
+    def __init__(self, seed=None, length=32, prefix="0x", rng=None):
+        super().__init__(seed=seed, length=length, prefix=prefix, rng=rng)
 
 class RndV(_RndBase):
     """
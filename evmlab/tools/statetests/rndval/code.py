@@ -9,12 +9,14 @@ class _RndCodeBase(_RndBase):
 
     FLAG_FOCUS_CONSTANTINOPLE = 1
 
-    def __init__(self, seed=None, length=None, prefix="0x", fill_arguments=True, flags=[], _config=None):
-        super().__init__(seed=seed, _config=_config)
+    def __init__(self, seed=None, length=None, prefix="0x", fill_arguments=True, flags=[], _config=None, rng=None):
+        super().__init__(seed=seed, _config=_config, rng=rng)
         self.length = length
         self.prefix = prefix
         self.fill_arguments = fill_arguments
         self.flags = set(flags)
+        # The WeightedRandomizers of the opcodes, created on first use
+        self._randomizers = None
 
     def _config_getint(self, key, default=None):
         if not self._config:
@@ -353,21 +355,16 @@ class RndCodeBytes(_RndCodeBase):
 
     def random_code_byte_sequence(self, length=None):
         # todo: add gauss histogramm random.randgauss(min,max,avg) - triangle is not really correct here
-        length = length or int(random.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
+        length = length or int(self.rng.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
 
-        rnd_prolog = WeightedRandomizer(self.LIKELYHOOD_PROLOG_BY_OPCODE_INT)
-        rnd_epilog = WeightedRandomizer(self.LIKELYHOOD_EPILOG_BY_OPCODE_INT)  # not completely true as this incorps. pro/epilog
-        rnd_corpus = WeightedRandomizer(self.LIKELYHOOD_BY_OPCODE_INT)
+        if self._randomizers is None:
+            self._randomizers = (WeightedRandomizer(self.LIKELYHOOD_PROLOG_BY_OPCODE_INT, rng=self._rng),
+                                 WeightedRandomizer(self.LIKELYHOOD_BY_OPCODE_INT, rng=self._rng),
+                                 WeightedRandomizer(self.LIKELYHOOD_EPILOG_BY_OPCODE_INT, rng=self._rng))  # not completely true as this incorps. pro/epilog
+        (rnd_prolog, rnd_corpus, rnd_epilog) = self._randomizers
 
-        b = []
-        for _ in range(128):
-            b.append(rnd_prolog.random())
-        for _ in range(length - 128 * 2):
-            b.append(rnd_corpus.random())
-        for _ in range(128):
-            b.append(rnd_epilog.random())
-
-        return bytes(b)
+        # the opcodes of each part are drawn at once
+        return bytes(rnd_prolog.sample(128) + rnd_corpus.sample(length - 128 * 2) + rnd_epilog.sample(128))
 
     def generate(self, length=50):
         return "%s%s" % (self.prefix,
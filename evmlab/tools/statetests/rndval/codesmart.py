@@ -100,6 +100,88 @@ from evmlab import decode_hex
 def as_bytes(s):
     return decode_hex(s)
 
+
+# The arguments RndCodeInstr pushes for an instruction, drawn with the RndCodeInstr
+def _small_memory_length(rnd):
+    return rnd.randomSmallMemoryLength()
+
+def _memory_length(rnd):
+    return rnd.randomMemoryLength()
+
+def _address(rnd):
+    return rnd._track_address(RndDestAddress(rng=rnd.rng).as_bytes())
+
+def _value(rnd):
+    return rnd.randomUniInt(max=255)
+
+def _uint(rnd):
+    return rnd.randomUniInt()
+
+def _storage_key(rnd):
+    # use 0-3 for storage keys/vals, to do overwrites and no-change writes.
+    return rnd.randomUniInt(max=3)
+
+def _storage_slot(rnd):
+    # sstore mostly at 0-3, but want some sloads on empty locations
+    return rnd.randomUniInt(max=8)
+
+def _word(rnd):
+    return rnd.randomByteSequence(rnd.randomLength32())
+
+# The arguments pushed (in this order) for the instructions, when smart code is generated
+smart_arguments_by_name = {
+    # There can be any number of topics,
+    # followed by memstart and memsize, which must be reasonable
+    "LOG": (_small_memory_length, _small_memory_length),  # msize, mstart
+    "MLOAD": (_small_memory_length,),
+    "MSTORE": (_word, _small_memory_length),
+    # We skip pushing the value, and use whatever is already on the stack
+    # Only set a reasonable offset
+    "MSTORE8": (_small_memory_length,),
+    "RETURNDATACOPY": (_small_memory_length, _small_memory_length, _small_memory_length),
+    "EXTCODECOPY": (_small_memory_length, _memory_length, _small_memory_length, _address),  # length, codeoffset, memoffset, address
+    "CODECOPY": (_small_memory_length, _memory_length, _small_memory_length),  # length, codeoffset, memoffset
+    "CREATE": (_small_memory_length, _small_memory_length, _value),
+    "CALL": (_small_memory_length,) * 4 + (_value, _address, _uint),  # ..., value, address, gas
+    "CALLCODE": (_small_memory_length,) * 4 + (_value, _address, _uint),
+    "STATICCALL": (_small_memory_length,) * 4 + (_address, _uint),  # retsize, retoffset, insize, inoffset, address, gas
+    "DELEGATECALL": (_small_memory_length,) * 4 + (_address, _uint),
+    "SUICIDE": (_address,),
+    "SELFDESTRUCT": (_address,),  # SUICIDE, as evmdasm names it
+    "RETURN": (_small_memory_length, _small_memory_length),
+    "REVERT": (_small_memory_length, _small_memory_length),
+    # todo: rework
+    "CREATE2": (_uint, _small_memory_length, _small_memory_length, _value),  # salt, ..., value
+    "SSTORE": (_storage_key, _storage_key),
+    "SLOAD": (_storage_slot,),
+    # todo: rework
+    "EXTCODEHASH": (_address,),
+    "EXTCODESIZE": (_address,),
+}
+
+
+def _instruction_template(instr):
+    """ Returns (the instruction as bytes, its arguments, its arguments when smart code is generated
+    (None if not special), the length of its operand) for an evmdasm instruction
+    """
+    args = (_word,) * len(instr.args)
+    smart_args = None
+    if instr.name.startswith("SWAP"):
+        smart_args = (_word,) * (instr.opcode - 0x90 + 2)  # SWAP1 = 0x90
+    elif instr.name.startswith("DUP"):
+        smart_args = (_word,) * (instr.opcode - 0x80 + 1)  # DUP1 = 0x80
+    elif instr.name.startswith("LOG"):
+        smart_args = smart_arguments_by_name["LOG"]
+    elif instr.name in smart_arguments_by_name:
+        smart_args = smart_arguments_by_name[instr.name]
+    elif instr.category in ("bitwise-logic", "comparison"):
+        smart_args = (_uint,) * len(instr.args)
+    return bytes([instr.opcode]) + instr.operand_bytes, args, smart_args, instr.length_of_operand
+
+
+# opcode -> the template RndCodeInstr fills the instruction from
+instruction_templates = [_instruction_template(asm_registry.create_instruction(opcode=opcode)) for opcode in range(256)]
+
 class RndCodeInstr(_RndCodeBase):
     """
     Random bytecode based on stat spread of instructions
@@ -117,9 +199,9 @@ class RndCodeInstr(_RndCodeBase):
 
     def random_code_byte_sequence(self, length=None):
         # todo: add gauss histogramm random.randgauss(min,max,avg) - triangle is not really correct here
-        length = length or int(random.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
+        length = length or int(self.rng.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
 
-        b = [random.choice(constantinople_skewed_set) for _ in range(length)]
+        b = [self.rng.choice(constantinople_skewed_set) for _ in range(length)]
 
         return bytes(b)
 
@@ -127,131 +209,29 @@ class RndCodeInstr(_RndCodeBase):
         self._addresses_seen.add(binascii.hexlify(address).decode("utf-8"))
         return address
 
-    def _fill_arguments(self, instructions):
+    def _fill_arguments(self, opcodes, code):
         #https://github.com/ethereum/testeth/blob/7cbbb6fed4941420fbae738828fa1339c990e3d3/test/tools/fuzzTesting/fuzzHelper.cpp#L391
-        def create_push_for_data(data):
-            # expect bytes but silently convert int2bytes
-            if isinstance(data, int):
-                data = int2bytes(data)
-
-            instr = asm_registry.create_instruction("PUSH%d"%len(data))
-            instr.operand_bytes = data
-            return instr
-
-        for instr in instructions:
-            args_filled = False
-            if self.randomPercent() < self._config_getint("engine.RndCodeInstr.smartCodeProbability.p", 990)/10:
-                # push arguments code
-                if instr.name.startswith("PUSH"):
-                    instr.randomize_operand()
-                elif instr.name.startswith("SWAP"):
-                    times = instr.opcode - asm_registry.create_instruction("SWAP1").opcode +2
-                    for _ in range(times):
-                        yield asm_registry.create_instruction("PUSH%s"%self.randomUniInt(1,32)).randomize_operand()
-                    args_filled = True
-                elif instr.name.startswith("DUP"):
-                    times = instr.opcode - asm_registry.create_instruction("DUP1").opcode + 1
-                    for _ in range(times):
-                        yield asm_registry.create_instruction("PUSH%s"%self.randomUniInt(1,32)).randomize_operand()
-                    args_filled = True
-                elif instr.name.startswith("LOG"):
-                    # There can be any number of topics, 
-                    # followed by memstart and memsize, which must be reasonable
-                    yield create_push_for_data(self.randomSmallMemoryLength()) # msize
-                    yield create_push_for_data(self.randomSmallMemoryLength()) # mstart
-                    args_filled = True
-                elif instr.name=="MLOAD":
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    args_filled = True
-                elif instr.name=="MSTORE":
-                    yield create_push_for_data(self.randomByteSequence(self.randomLength32()))
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    args_filled = True
-                elif instr.name=="MSTORE8":
-                    #yield create_push_for_data(self.randomByteSequence(self.randomLength32())) # value
-                    # We skip pushing the value, and use whatever is already on the stack
-                    # Only set a reasonable offset
-                    yield create_push_for_data(self.randomSmallMemoryLength()) # offset
-                    args_filled = True
-                elif instr.name=="RETURNDATACOPY":
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    args_filled = True
-                elif instr.name=="EXTCODECOPY":
-                    yield create_push_for_data(self.randomSmallMemoryLength())   # length
-                    yield create_push_for_data(self.randomMemoryLength())        # codeoffset
-                    yield create_push_for_data(self.randomSmallMemoryLength())   # memoffset
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))      # address
-                    args_filled = True
-                elif instr.name=="CODECOPY":
-                    yield create_push_for_data(self.randomSmallMemoryLength())   # length
-                    yield create_push_for_data(self.randomMemoryLength())        # codeoffset
-                    yield create_push_for_data(self.randomSmallMemoryLength())   # memoffset
-                    args_filled = True
-                elif instr.name=="CREATE":
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomUniInt(max=255))
-                    args_filled = True
-                elif instr.name in ("CALL", "CALLCODE"):
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomUniInt(max=255))   # value
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))  # address
-                    yield create_push_for_data(self.randomUniInt())          # gas 
-                    args_filled = True
-                elif instr.name in ("STATICCALL","DELEGATECALL"):
-                    yield create_push_for_data(self.randomSmallMemoryLength()) # retsize
-                    yield create_push_for_data(self.randomSmallMemoryLength()) # retoffset
-                    yield create_push_for_data(self.randomSmallMemoryLength()) # insize
-                    yield create_push_for_data(self.randomSmallMemoryLength()) # inoffset
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))
-                    yield create_push_for_data(self.randomUniInt())            # gas
-                    args_filled = True
-                elif instr.name=="SUICIDE":
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))
-                    args_filled = True
-                elif instr.name in ("RETURN","REVERT"):
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    args_filled = True
-                elif instr.name=="CREATE2":
-                    # todo: rework
-                    yield create_push_for_data(self.randomUniInt()) # salt
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomSmallMemoryLength())
-                    yield create_push_for_data(self.randomUniInt(max=255)) # value
-                    args_filled = True
-                elif instr.name=="SSTORE":
-                    # use 0-3 for storage keys/vals, to do overwrites and no-change writes.
-                    yield create_push_for_data(self.randomUniInt(max=3))
-                    yield create_push_for_data(self.randomUniInt(max=3))
-                    args_filled = True
-                elif instr.name=="SLOAD":
-                    # sstore mostly at 0-3, but want some sloads on empty locations
-                    yield create_push_for_data(self.randomUniInt(max=8))
-                    args_filled = True
-                elif instr.name in ["EXTCODEHASH", "EXTCODESIZE"]:
-                    # todo: rework                    
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))  # address
-                    args_filled = True
-                elif instr.category in ("bitwise-logic","comparison"):
-                    for _ in instr.args:
-                        yield create_push_for_data(self.randomUniInt())
-                    args_filled = True
-
-
-            #  create random args for all other instructions.
-            if not args_filled:
-                # if args have not been pushed create random args.
-                for _ in instr.args:
-                    yield create_push_for_data(self.randomByteSequence(self.randomLength32()))
-
+        # Emits the instructions into code, each preceded by the PUSHes of its arguments (see instruction_templates)
+        p = self._config_getint("engine.RndCodeInstr.smartCodeProbability.p", 990)/10
+        for opcode in opcodes:
+            (instruction, args, smart_args, operand) = instruction_templates[opcode]
+            if self.randomPercent() < p:
+                if smart_args is not None:
+                    args = smart_args
+                elif operand:
+                    # randomize the operand of a PUSH
+                    code.append(opcode)
+                    code += self.randomByteSequence(operand)
+                    continue
+            for arg in args:
+                data = arg(self)
+                # expect bytes but silently convert int2bytes
+                if isinstance(data, int):
+                    data = int2bytes(data)
+                code.append(0x5f + len(data))  # PUSH<len>
+                code += data
             # finally push instruction
-            yield instr
+            code += instruction
 
     def generate(self, length=None):
 
@@ -262,12 +242,11 @@ class RndCodeInstr(_RndCodeBase):
 
         self._addresses_seen = set([])  # todo: hacky
 
-        instructions = [asm_registry.create_instruction(opcode=opcode) for opcode in self.random_code_byte_sequence(length)]
+        opcodes = self.random_code_byte_sequence(length)
         if self.fill_arguments:
-            instructions = self._fill_arguments(instructions)
-
-        serialized = ''.join(e.serialize() for e in instructions)     
-#        asm = ' '.join(str(e) for e in instructions)
-#        print(asm)
+            code = bytearray()
+            self._fill_arguments(opcodes, code)
+        else:
+            code = b"".join(instruction_templates[opcode][0] for opcode in opcodes)
 
-        return "%s%s" % (self.prefix, serialized)
+        return "%s%s" % (self.prefix, code.hex())
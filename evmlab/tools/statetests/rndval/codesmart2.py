@@ -4,7 +4,7 @@ import evmcodegen
 from evmcodegen.codegen import Rnd
 from .code import _RndCodeBase
 from .address import RndAddress, RndDestAddress, RndAddressType
-from .base import WeightedRandomizer
+from .base import WeightedRandomizer, seeded_random
 
 
 VALUEMAP ={
@@ -119,6 +119,11 @@ class RndCodeSmart2(_RndCodeBase):
     # analyzed based on statedump.json
 
     def generate(self, length=None):
+        # evmcodegen and evmdasm draw from the random module, which is seeded from self.rng meanwhile
+        with seeded_random(self.rng):
+            return self._generate(length)
+
+    def _generate(self, length=None):
         # override this in here to adjust weights
         distribution = getattr(evmcodegen.distributions,
                                 self._config_get("engine.RndCodeSmart2.distribution", ""),
@@ -152,7 +157,7 @@ class RndCodeSmart2(_RndCodeBase):
                        InstructionMutators.drop_item: self._config_getint("engine.RndCodeSmart2.mutate.instructions.drop_item.weight", 10),
                        InstructionMutators.dup_instruction: self._config_getint("engine.RndCodeSmart2.mutate.instructions.dup_instruction.weight", 20),
                        InstructionMutators.insert_random_instructions: self._config_getint("engine.RndCodeSmart2.mutate.instructions.insert_random_instructions.weight", 10)}
-            mutator = WeightedRandomizer(weights=weights)
+            mutator = WeightedRandomizer(weights=weights, rng=self.rng)
             evmcode.instructions = mutator.random()(evmcode.instructions,Rnd.uni_integer(1,self._config_getint("engine.RndCodeSmart2.mutate.instructions.max_amount", 3)))
 
         # mutate evmbytecode in 0.1% of  - very likely invalid code
@@ -161,7 +166,7 @@ class RndCodeSmart2(_RndCodeBase):
                        BytecodeMutators.insert_random_bytes: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.insert_random_bytes.weight", 10),
                        BytecodeMutators.drop_byte: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.drop_byte.weight", 20),
                        BytecodeMutators.switch_random: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.switch_random.weight", 20)}
-            mutator = WeightedRandomizer(weights=weights)
+            mutator = WeightedRandomizer(weights=weights, rng=self.rng)
             evmcode.instructions = evmdasm.EvmBytecode(mutator.random()(evmcode.assemble().as_bytes, Rnd.uni_integer(1, self._config_getint("engine.RndCodeSmart2.mutate.bytecode.max_amount", 3)))).disassemble()
 
         return "0x%s" % evmcode.assemble().as_hexstring
@@ -15,6 +15,10 @@ logger = logging.getLogger("evmlab.tools.statetest")
 
 
 class Account(object):
+    """ An account of the prestate. Its values are generated once, when it's first used, and reused
+    (along with their json encoding) until the account is renewed, i.e. replaced by a new Account.
+    The balance is drawn anew on every fill, unless it's a fixed value
+    """
 
     def __init__(self, address, balance=None, code=None, nonce=None, storage=None):
         self.address = address
@@ -22,6 +26,9 @@ class Account(object):
         self.code = code if code is not None else ''
         self.nonce = nonce
         self.storage = storage if storage is not None else {}
+        self._balance = None
+        self._materialized = None
+        self._fragment = None
 
     @property
     def __dict__(self):
@@ -30,15 +37,35 @@ class Account(object):
                 "nonce": self.nonce,
                 "storage": self.storage}
 
+    def materialize(self):
+        """ Returns the generated values of the account, with a new balance """
+        self._balance = randomtest.materialize(self.balance)
+        if self._materialized is None:
+            self._materialized = randomtest.materialize({"code": self.code,
+                                                         "nonce": self.nonce,
+                                                         "storage": self.storage})
+        return dict(balance=self._balance, **self._materialized)
+
+    def fragment(self):
+        """ Returns the json encoding of the values last generated (see materialize) """
+        if self._fragment is None:
+            # without the opening brace, which precedes the balance
+            self._fragment = json.dumps(self._materialized)[1:]
+        return '{"balance": %s, %s' % (json.dumps(self._balance), self._fragment)
 
 
 class StateTestTemplate(object):
 
     def __init__(self, nonce=None, codegenerators={}, datalength=None,
-                 fill_prestate_for_tx_to=True, fill_prestate_for_args=False, _config=None):
+                 fill_prestate_for_tx_to=True, fill_prestate_for_args=False, _config=None, seed=None):
         ### global settings
-        self._nonce = nonce if nonce is not None else str(rndval.RndV())
         self._config = _config
+        # Each test is generated from a seed of its own, with this instance (see fill). The seeds, and
+        # the values the template is created with, derive from the seed of the template
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self._seeds = random.Random(self.seed)
+        self.rng = random.Random(self._seeds.getrandbits(64))
+        self._nonce = nonce if nonce is not None else str(rndval.RndV(rng=self.rng))
         ### set by setters below
         self._codegenerators = None  # default
         self._codegenerators_weighted = None
@@ -57,15 +84,18 @@ class StateTestTemplate(object):
         ### info
         self._info = SimpleNamespace(fuzzer="evmlab",
                                      comment=self._config_get("info.comment", "evmlab"),
-                                     filledwith="evmlab randomfuzz")
+                                     filledwith="evmlab randomfuzz",
+                                     template="0x%016x" % self.seed,
+                                     fill=0,
+                                     seed=None)
 
         ### env
-        self._env = SimpleNamespace(currentCoinbase=self._config_get("env.coinbase", rndval.RndSourceAddress()),
+        self._env = SimpleNamespace(currentCoinbase=self._config_get("env.coinbase", rndval.RndSourceAddress(rng=self.rng)),
                                     currentDifficulty=self._config_get("env.difficulty", "0x20000"),
                                     currentGasLimit=self._config_get("env.gaslimit", "0x1312D00"),
                                     currentNumber=self._config_get("env.number", "1"),
                                     currentTimestamp=self._config_get("env.timestamp", "1000"),
-                                    previousHash=self._config_get("env.previousHash", rndval.RndHash32()))
+                                    previousHash=self._config_get("env.previousHash", rndval.RndHash32(rng=self.rng)))
 
         ### post
         self._post = {"Byzantium": [
@@ -81,13 +111,14 @@ class StateTestTemplate(object):
 
         ### transaction
         self._transaction = SimpleNamespace(secretKey="0x45a915e4d060149eb4365960e6a7a45f334393093061116b197e3240065ff2d8",
-                                            data=[RndCodeBytes().generate(length=self._datalength)],
-                                            gasLimit=[rndval.RndTransactionGasLimit(_min=self._config_getint("transaction.gaslimit.random.min",34*14000))],
-                                            gasPrice=rndval.RndGasPrice(),
+                                            data=[RndCodeBytes(rng=self.rng).generate(length=self._datalength)],
+                                            gasLimit=[rndval.RndTransactionGasLimit(_min=self._config_getint("transaction.gaslimit.random.min",34*14000), rng=self.rng)],
+                                            gasPrice=rndval.RndGasPrice(rng=self.rng),
                                             nonce=self._nonce,
-                                            to=rndval.RndDestAddressOrZero(),
+                                            to=rndval.RndDestAddressOrZero(rng=self.rng),
                                             value=[rndval.RndHexInt(_min=self._config_getint("transaction.value.random.min", 0),
-                                                                    _max=self._config_getint("transaction.value.random.max", 2**24))])
+                                                                    _max=self._config_getint("transaction.value.random.max", 2**24),
+                                                                    rng=self.rng)])
 
     def _config_getint(self, key, default=None):
         if not self._config or not self._config.statetest:
@@ -105,8 +136,8 @@ class StateTestTemplate(object):
         return self._config.statetest.getboolean(key, default)
 
     def _random_storage(self, _min=0, _max=10):
-        hx = rndval.RndHex32()
-        rnd_vals = (hx.generate() for _ in range(random.randint(_min, _max)))
+        hx = rndval.RndHex32(rng=self.rng)
+        rnd_vals = (hx.generate() for _ in range(self.rng.randint(_min, _max)))
         return {hx:hx for hx in rnd_vals}
 
 
@@ -147,7 +178,7 @@ class StateTestTemplate(object):
             if codelength_min == codelength_max or codelength_max is None:
                 codelength = codelength_min
             else:
-                codelength = random.randint(codelength_min, codelength_max)
+                codelength = self.rng.randint(codelength_min, codelength_max)
         else:
             codelength = None
 
@@ -181,7 +212,7 @@ class StateTestTemplate(object):
         all_addresses = list(all_addresses.difference(rndval.RndAddress.addresses[rndval.RndAddressType.PRECOMPILED] + [tx.to.replace("0x","")]))
 
         # shuffle list to avoid bailing always on the same objects (set is ordered)
-        random.shuffle(all_addresses)
+        self.rng.shuffle(all_addresses)
 
         for addr in all_addresses:
             #print(addr)
@@ -227,11 +258,12 @@ class StateTestTemplate(object):
 
         self.add_prestate(address=env.currentCoinbase, code="")
 
+        # accounts which were not renewed keep their generated values, apart from the balance (see Account)
         return {"randomStatetest": {
                        "_info": self.info.__dict__,
                        "env": env.__dict__,
                        "post": self.post,
-                       "pre": {address: a.__dict__ for address,a in self.pre.items()},
+                       "pre": {address: a.materialize() for address,a in self.pre.items()},
                        "transaction": tx.__dict__}}
 
     @property
@@ -240,10 +272,10 @@ class StateTestTemplate(object):
 
     @codegens.setter
     def codegens(self, weighted_codegens):
-        self._codegenerators = {engine: engine(_config=self._config.codegen if self._config else None) for engine in
-                                weighted_codegens.keys()}  # instantiate available code generators
+        self._codegenerators = {engine: engine(_config=self._config.codegen if self._config else None, rng=self.rng)
+                                for engine in weighted_codegens.keys()}  # instantiate available code generators
         self._codegenerators_weighted = WeightedRandomizer(
-            {self._codegenerators[engine]: weight for engine, weight in weighted_codegens.items()})  #
+            {self._codegenerators[engine]: weight for engine, weight in weighted_codegens.items()}, rng=self.rng)  #
 
     @property
     def datalength(self):
@@ -283,7 +315,7 @@ class StateTestTemplate(object):
 
     def add_prestate(self, address, balance=None, code=None, nonce=None, storage=None):
         acc = Account(address=address,
-                      balance=balance,
+                      balance=balance if balance is not None else rndval.RndHexInt(_min=2**24-1, rng=self.rng),
                       code=code if code is not None else self.pick_codegen().generate(),
                       nonce=nonce if nonce is not None else self._nonce,  # use global nonce if not explicitly set
                       storage=storage)
@@ -320,10 +352,48 @@ class StateTestTemplate(object):
     def json(self):
         return json.dumps(self.__dict__, cls=randomtest.RandomTestsJsonEncoder)
 
-    def fill(self):
+    def fill(self, seed=None, serialize=False, name="randomStatetest"):
+        """ Fills the template from a 64-bit seed (a new one, if not given), which is recorded in
+        the _info of the test, along with the seed of the template and the number of the fill.
+        The prestates, with the accounts generated for them, carry over from the earlier fills, so
+        a test is regenerated from the latter two (see replay).
+        Returns the test (named name) as plain values, and the json encoded test as well if serialize
+        is set. The encoding reuses the encoded accounts of the prestate which were not renewed,
+        only their balance is encoded again
+        """
+        if seed is None:
+            seed = self._seeds.getrandbits(64)
+        self.rng.seed(seed)
+        self._info.seed = "0x%016x" % seed
         self._fill_counter += 1
+        self._info.fill = self._fill_counter
         # will be filled by _build
-        return json.loads(self.json())
+        test = randomtest.materialize(self._build())
+        if name != "randomStatetest":
+            test[name] = test.pop("randomStatetest")
+        if serialize:
+            return test, self._serialize(name, test[name]).encode()
+        return test
+
+    def replay(self, fill, serialize=False, name="randomStatetest"):
+        """ Regenerates the test of the given fill (see _info), on a template which was created with
+        the same seed and settings, and was not filled yet. The earlier fills are repeated
+        """
+        if self._fill_counter != 0:
+            raise ValueError("The template was filled already")
+        for _ in range(fill - 1):
+            self.fill()
+        return self.fill(serialize=serialize, name=name)
+
+    def _serialize(self, name, test):
+        """ The json encoding of {name: test}, the same as json.dumps, with the accounts of the
+        prestate taken from their cached encodings
+        """
+        pre = "{%s}" % ", ".join("%s: %s" % (json.dumps(address), self.pre[address].fragment())
+                                 for address in test["pre"])
+        body = ", ".join("%s: %s" % (json.dumps(key), pre if key == "pre" else json.dumps(value))
+                         for key, value in test.items())
+        return "{%s: {%s}}" % (json.dumps(name), body)
 
 
 if __name__=="__main__":
@@ -0,0 +1,105 @@
+"""
+Vectorized comparison of (very) long canonical traces, using numpy.
+
+The pc, op, gas and depth of each step, and a hash of its stack, are loaded into one array
+per column, and the first mismatching step is found with a vectorized comparison. Only the
+steps around it are compared and rendered step by step, by vm.compare_traces.
+"""
+import logging
+import operator
+
+from . import vm
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# op and depth of entries which are not a Step (e.g. the StateRoot)
+NO_STEP = -1
+
+
+def _noStep(step):
+    """ The row of an entry which is not a Step. It has no pc etc, and the encoded entry
+    takes the place of the stack """
+    return vm.Step(NO_STEP, NO_STEP, 0, NO_STEP, vm.encodeStep(step))
+
+
+class TraceArrays(object):
+    """ The columns of a canonical trace. The steps themselves are kept as well, for the
+    stacks and for rendering the steps around a difference
+    """
+
+    def __init__(self, steps):
+        if numpy is None:
+            raise ImportError("numpy not installed. run `#> pip install evmlab[numpy]` to install.")
+        self.steps = steps if type(steps) is list else list(steps)
+        Step = vm.Step
+        rows = [step if type(step) is Step else _noStep(step) for step in self.steps]
+
+        def column(index, dtype, func=None):
+            values = map(operator.itemgetter(index), rows)
+            if func is not None:
+                values = map(func, values)
+            return numpy.fromiter(values, dtype=dtype, count=len(rows))
+
+        self.pc = column(0, numpy.int64)
+        self.op = column(1, numpy.int16)
+        self.gas = column(2, numpy.uint64)
+        self.depth = column(3, numpy.int16)
+        # Stacks (and memory) are compared by hash; the steps around the first difference
+        # are compared in full, as well
+        self.stack = column(slice(4, None), numpy.int64, hash)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def columns(self):
+        return (self.pc, self.op, self.gas, self.depth, self.stack)
+
+    def stats(self):
+        """ Returns the same statistics as vm.Stats.result() """
+        return {
+            "maxDepth": int(max(self.depth.max(), 0)) if len(self) else 0,
+            "constatinopleOps": int(numpy.isin(self.op, list(vm.CONSTANTINOPLE_OPS)).sum()),
+            "steps": len(self),
+        }
+
+
+def first_difference(arrays):
+    """ Returns the index of the first step where any of the traces differs from the first
+    one, or None if they are equal """
+    if len(arrays) == 0:
+        return None
+    n = min(len(a) for a in arrays)
+    first = None
+    for other in arrays[1:]:
+        mismatch = numpy.zeros(n, dtype=bool)
+        for (x, y) in zip(arrays[0].columns(), other.columns()):
+            mismatch |= x[:n] != y[:n]
+        indices = numpy.flatnonzero(mismatch)
+        if len(indices) > 0 and (first is None or indices[0] < first):
+            first = int(indices[0])
+    if first is None and any(len(a) != len(arrays[0]) for a in arrays):
+        # One trace is a prefix of the others
+        first = n
+    return first
+
+
+def compare_traces(clients_canon_traces, names, history=None, tail=None):
+    """ Same as vm.compare_traces, but the traces are loaded into arrays, and only compared
+    step by step from `history` steps in front of the first difference.
+    Returns (equivalent, output, stats), with the stats of each trace
+    """
+    arrays = [a if isinstance(a, TraceArrays) else TraceArrays(a) for a in clients_canon_traces]
+    first = first_difference(arrays)
+    if first is None:
+        first = max([len(a) for a in arrays] + [0])
+    start = 0
+    if history is not None:
+        start = max(0, first - history)
+    (equivalent, output) = vm.compare_traces([a.steps for a in arrays], names,
+                                             history=history, tail=tail, start=start)
+    return (equivalent, output, [a.stats() for a in arrays])
@@ -1,9 +1,11 @@
-import os, signal, json, itertools, traceback, sys
+import os, signal, json, itertools, collections, traceback, sys
+import hashlib, struct, mmap
 from subprocess import Popen, PIPE, TimeoutExpired
 import platform
 import logging
 import re
 from . import opcodes
+from . import fastjson
 from . import parse_int_or_hex,decode_hex,remove_0x_head
 
 logger = logging.getLogger()
@@ -32,10 +34,128 @@ def toHexQuantities(vals):
     """ Formats a list of values into a list of hex-encoded values """
     return ['0x{0:01x}'.format(parse_int_or_hex(val)) for val in vals]
 
+def toGas(val):
+    """ Gas is either an int or a hex string, depending on the client """
+    if isinstance(val, int):
+        return val
+    return int(val, 16)
+
+# The canonical trace steps emitted by the canonicalizers. These are plain tuples, so
+# comparing two steps is a single tuple comparison, and no text is formatted unless
+# the step is rendered (see toText).
+# pc, op, gas and depth are ints, stack is a tuple of hex strings, memory is a hex string
+# (only at the full+memory fidelity, None otherwise)
+Step = collections.namedtuple("Step", ["pc", "op", "gas", "depth", "stack", "memory"], defaults=(None,))
+StateRoot = collections.namedtuple("StateRoot", ["stateRoot"])
+# The gas used by the transaction, which is only compared at the stateroot-only fidelity
+# (at the other levels, the steps already tell). An int
+GasUsed = collections.namedtuple("GasUsed", ["gasUsed"])
+
+# The fidelity of the canonical traces, i.e. which parts of the steps are compared. Cheaper
+# levels let the clients trace less, and the canonicalizers decode less.
+# steps: whether steps (pc, op, depth) are included at all, or only the stateRoot and gasUsed
+Fidelity = collections.namedtuple("Fidelity", ["steps", "gas", "stack", "memory"])
+FIDELITY_LEVELS = collections.OrderedDict([
+    ("stateroot-only", Fidelity(steps=False, gas=False, stack=False, memory=False)),
+    ("ops",            Fidelity(steps=True,  gas=False, stack=False, memory=False)),
+    ("ops+gas",        Fidelity(steps=True,  gas=True,  stack=False, memory=False)),
+    ("full-stack",     Fidelity(steps=True,  gas=True,  stack=True,  memory=False)),
+    ("full+memory",    Fidelity(steps=True,  gas=True,  stack=True,  memory=True)),
+])
+DEFAULT_FIDELITY = "full-stack"
+
+def fidelityLevel(fidelity):
+    """ Returns the Fidelity of the named level """
+    if fidelity not in FIDELITY_LEVELS:
+        raise ValueError("Unknown trace fidelity %r, expected one of %s" % (fidelity, ", ".join(FIDELITY_LEVELS)))
+    return FIDELITY_LEVELS[fidelity]
+
+def reduceTrace(steps, fidelity):
+    """ Reduces a canonical trace to the given fidelity, dropping what is not compared at that level """
+    level = fidelityLevel(fidelity)
+    if level.memory:
+        return steps
+    if not level.steps:
+        return (step for step in steps if type(step) is not Step)
+    return (Step(step.pc, step.op, step.gas if level.gas else 0, step.depth,
+                 step.stack if level.stack else ()) if type(step) is Step else step
+            for step in steps)
+
+def _isStepLine(line):
+    """ Whether a json trace line (of geth or parity) is a step, without decoding it """
+    return line[:5] in ('{"pc"', b'{"pc"')
+
+CONSTANTINOPLE_OPS = frozenset([0x1b, 0x1c, 0x1d, 0x3F,0xF5])
+
+# pc, op, gas, depth, length of the encoded stack
+_STEP_HEADER = struct.Struct("<QBQhI")
+
+def encodeStep(step):
+    """ Encodes a canonical step into bytes, for digesting """
+    if type(step) is Step:
+        stack = ",".join(step.stack).encode()
+        encoded = b"S" + _STEP_HEADER.pack(step.pc, step.op, step.gas, step.depth, len(stack)) + stack
+        if step.memory is not None:
+            encoded = encoded + b"M" + step.memory.encode()
+        return encoded
+    if type(step) is StateRoot:
+        return b"R" + step.stateRoot.encode()
+    if type(step) is GasUsed:
+        return b"G" + str(step.gasUsed).encode()
+    return b"J" + json.dumps(step, sort_keys=True).encode()
+
+class TraceDigest(object):
+    """ Folds a canonical trace into a rolling blake2b digest, recording a checkpoint of
+    the digest every `interval` steps. If the digests of two traces are equal, so are the traces,
+    and if they're not, the checkpoints tell how far into the traces they are still equal.
+    """
+
+    def __init__(self, interval=1000):
+        self.interval = interval
+        self.count = 0
+        self.checkpoints = []
+        self._hash = hashlib.blake2b(digest_size=20)
+
+    def fold(self, steps):
+        """ Folds the steps into the digest, yielding them as they pass through """
+        for step in steps:
+            self._hash.update(encodeStep(step))
+            self.count = self.count + 1
+            if self.count % self.interval == 0:
+                self.checkpoints.append(self._hash.digest())
+            yield step
+
+    def consume(self, steps):
+        for step in self.fold(steps):
+            pass
+        return self
+
+    def digest(self):
+        return self._hash.digest()
+
+    @staticmethod
+    def equal(digests):
+        """ Returns true if all digests are for equal traces """
+        first = digests[0]
+        return all(d.count == first.count and d.digest() == first.digest() for d in digests[1:])
+
+    @staticmethod
+    def commonPrefix(digests):
+        """ Returns the number of steps that are known to be equal in all traces, going by the checkpoints """
+        if TraceDigest.equal(digests):
+            return digests[0].count
+        common = 0
+        for checkpoints in zip(*[d.checkpoints for d in digests]):
+            if any(c != checkpoints[0] for c in checkpoints[1:]):
+                break
+            common = common + 1
+        return common * digests[0].interval
+
 class Stats():
     def __init__(self):
         self.maxdepth= 0
         self.numConstantinople = 0
+        self.numSteps = 0
         self.stopped = False
 
     def traceStats(self, canon_trace):
@@ -48,11 +168,18 @@ class Stats():
                 yield step
                 continue
 
-            if "depth" in step.keys() and int(step['depth']) > self.maxdepth:
-                self.maxdepth = int(step['depth'])
-            if "op" in step:
-                if step["op"] in [0x1b, 0x1c, 0x1d, 0x3F,0xF5]:
+            self.numSteps = self.numSteps + 1
+            if type(step) is Step:
+                if step.depth > self.maxdepth:
+                    self.maxdepth = step.depth
+                if step.op in CONSTANTINOPLE_OPS:
                     self.numConstantinople = self.numConstantinople + 1
+            elif isinstance(step, dict):
+                if "depth" in step.keys() and int(step['depth']) > self.maxdepth:
+                    self.maxdepth = int(step['depth'])
+                if "op" in step:
+                    if step["op"] in CONSTANTINOPLE_OPS:
+                        self.numConstantinople = self.numConstantinople + 1
             yield step
 
     def stop(self):
@@ -61,11 +188,32 @@ class Stats():
     def result(self):      
         return {
             "maxDepth": self.maxdepth, 
-            "constatinopleOps": self.numConstantinople
+            "constatinopleOps": self.numConstantinople,
+            "steps": self.numSteps,
         }
 
 
 def toText(op):
+    if type(op) is Step:
+        if op.op in opcodes.opcodes.keys():
+            opname = opcodes.opcodes[op.op][0]
+        else:
+            opname = "UNKNOWN"
+        stack = list(op.stack)
+        if len(stack) > 6:
+            stack = "... {}".format(stack[-4:])
+        text = "pc {:>5} op {:>10}({:>3}) gas {:>8} depth {:>2} stack {}".format(
+            op.pc, opname, op.op, '0x{0:01x}'.format(op.gas), op.depth, stack)
+        if op.memory is not None:
+            memory = op.memory
+            if len(memory) > 66:
+                memory = "...{}".format(memory[-64:])
+            text = text + " memory {}".format(memory)
+        return text
+    if type(op) is StateRoot:
+        return "stateRoot {}".format(op.stateRoot)
+    if type(op) is GasUsed:
+        return "gasUsed {}".format('0x{0:01x}'.format(op.gasUsed))
     if len(op.keys()) == 0:
         return "END"
     if 'pc' in op.keys():
@@ -99,18 +247,35 @@ def toText(op):
         return fmt.format(**op)
     return "N/A"
 
-def compare_traces(clients_canon_traces, names):
+def compare_traces(clients_canon_traces, names, history=None, tail=None, start=0, fidelity=None):
+
+    """ Compare 'canonical' traces from the clients
 
-    """ Compare 'canonical' traces from the clients"""
+    The traces are consumed lazily, one step at a time from each client. Equivalent steps
+    are only kept in a ring buffer of the `history` most recent steps (unbounded if None),
+    and no more steps are pulled from the clients once `tail` steps have been compared after
+    the first difference (all the way to the end if None).
+    The first `start` steps are known to be equivalent (see TraceDigest), and are skipped.
+    If a fidelity is given, the traces are reduced to that level before they are compared.
+    """
 
     full_output = []
     log = lambda x: full_output.append(x)
 
-    canon_traces = list(itertools.zip_longest(*clients_canon_traces))
+    if fidelity is not None:
+        clients_canon_traces = [reduceTrace(trace, fidelity) for trace in clients_canon_traces]
+
+    if start > 0:
+        clients_canon_traces = [itertools.islice(trace, start, None) for trace in clients_canon_traces]
+
+    # ring buffer of equivalent steps, flushed when a difference is found
+    recent = collections.deque([], history)
+    omitted = start
 
     num_clients = len(names)
     equivalent = True
-    for step in canon_traces:
+    remaining = tail
+    for step in itertools.zip_longest(*clients_canon_traces):
         wrong_clients = []
         step_equiv = True
         for i in range(1, num_clients):
@@ -118,18 +283,45 @@ def compare_traces(clients_canon_traces, names):
                 step_equiv = False
                 wrong_clients.append(i)
 
+        if equivalent:
+            if step_equiv:
+                if len(recent) == history:
+                    omitted += 1
+                recent.append(step[0])
+                continue
+            # First difference, flush what we have so far
+            equivalent = False
+            _log_recent(log, recent, omitted)
+        elif remaining is not None:
+            if remaining == 0:
+                break
+            remaining -= 1
+
         if step_equiv == True:
-            log('[*] {:>8} {}'.format("", step[0]))
+            log('[*] {:>8} {}'.format("", _render(step[0])))
         else:
-            equivalent = False
             for i in range(0, num_clients):
                 if i in wrong_clients or len(wrong_clients) == num_clients-1:
-                    log('[!!] {:>7} {}'.format(names[i], step[i]))
+                    log('[!!] {:>7} {}'.format(names[i], _render(step[i])))
                 else:
-                    log('[*] {:>8} {}'.format(names[i], step[i]))
+                    log('[*] {:>8} {}'.format(names[i], _render(step[i])))
+
+    if equivalent:
+        _log_recent(log, recent, omitted)
 
     return (equivalent, full_output)
 
+def _log_recent(log, recent, omitted):
+    if omitted > 0:
+        log('[..] {:>7} equivalent steps omitted'.format(omitted))
+    for step in recent:
+        log('[*] {:>8} {}'.format("", _render(step)))
+
+def _render(step):
+    """ Steps are only formatted as text when they are part of the report """
+    if type(step) in (Step, StateRoot, GasUsed):
+        return toText(step)
+    return step
 
 def startProc(cmd):
     # passing a list to Popen doesn't work. Can't read stdout from docker container when shell=False
@@ -155,6 +347,101 @@ def finishProc(process, extraTime=False, output="stdout", timeout = 30):
         return stdoutdata.decode().strip().split("\n")
     return stderrdata.decode().strip().split("\n")
 
+
+class TraceFile(object):
+    """ Memory-maps a trace file, and iterates over its lines as bytes. Like the lines of a
+    text file, they include the line terminator. The lines are split on the raw bytes, and
+    handed to the json decoder as-is, without going through the text layer.
+    Can be passed to all canonicalizers in place of an open text file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        self._mmap = None
+        if os.fstat(self._file.fileno()).st_size > 0:
+            # an empty file cannot be mapped
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        if self._mmap is None:
+            return iter(())
+        self._mmap.seek(0)
+        return iter(self._mmap.readline, b"")
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TailFile(object):
+    """ Follows a trace file which is still being written by a running client, and iterates
+    over its lines as bytes (like TraceFile) as soon as they are complete.
+    Iteration ends once `finished` (a threading.Event, set when the client has exited) is set,
+    and the rest of the file has been read. The file need not exist yet.
+    """
+
+    def __init__(self, filename, finished, interval=0.01):
+        self.filename = filename
+        self.finished = finished
+        self.interval = interval
+        self._file = None
+
+    def __iter__(self):
+        pending = b""
+        while True:
+            # Check before reading, so that nothing written before the client exited is missed
+            done = self.finished.is_set()
+            if self._file is None:
+                try:
+                    self._file = open(self.filename, "rb")
+                except FileNotFoundError:
+                    if done:
+                        return
+                    self.finished.wait(self.interval)
+                    continue
+            data = self._file.read()
+            if data:
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    yield line + b"\n"
+                continue
+            if done:
+                if pending:
+                    yield pending
+                return
+            self.finished.wait(self.interval)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def textLines(output):
+    """ Yields the lines of the output as str, for canonicalizers which parse text.
+    Lines read from a TraceFile are bytes """
+    for line in output:
+        if type(line) is bytes:
+            line = line.decode()
+        yield line
+
+
 class VM(object):
 
     def __init__(self,executable="evmbin", docker = False):
@@ -173,35 +460,38 @@ class VM(object):
 
 class JsVM(VM):
     @staticmethod
-    def canonicalized(output):
+    def canonicalized(output, fidelity=DEFAULT_FIDELITY):
         steps = []
-        for index, line in enumerate(output):
+        for index, line in enumerate(textLines(output)):
             if line and line.startswith('# {'):
                 result = json.loads(line.strip('# '))
+                if 'pc' in result and 'op' in result:
+                    result = Step(result['pc'], result['op'], toGas(result['gas']), result['depth'],
+                                  tuple(result['stack']))
+                elif 'stateRoot' in result:
+                    result = StateRoot(result['stateRoot'])
                 steps.append(result)
+        if fidelity != DEFAULT_FIDELITY:
+            return list(reduceTrace(steps, fidelity))
         return steps
 
 
 class HeraVM(VM):
     @staticmethod
-    def canonicalized(output):
+    def canonicalized(output, fidelity=DEFAULT_FIDELITY):
         from . import opcodes
         valid_opcodes = opcodes.reverse_opcodes.keys()
 
         steps = []
         for x in output:
             try:
-                if len(x) > 0  and x[0] == "{":
+                if x[:1] in ("{", b"{"):
                     step = json.loads(x)
                     if 'stateRoot' in step.keys() and INCLUDE_STATEROOT:
-                      steps.append(step)
+                      steps.append(StateRoot(step['stateRoot']))
                     else:
-                      step['gas'] = hex(step['gas'])
-                      step['stack'] = step['stack'][::-1]
-                      for i in range(0, len(step['stack'])):
-                          step['stack'][i] = re.sub(r'0x0+([0-9a-f]+)$', '0x\g<1>', step['stack'][i])
-
-                      steps.append(step)
+                      stack = tuple(re.sub(r'0x0+([0-9a-f]+)$', '0x\g<1>', el) for el in reversed(step['stack']))
+                      steps.append(Step(step['pc'], step['op'], toGas(step['gas']), step['depth'], stack))
 
             except Exception as e:
                 logger.info('Exception parsing Hera json:')
@@ -209,18 +499,20 @@ class HeraVM(VM):
                 logger.info('problematic line:')
                 logger.info(x[:500])
 
+        if fidelity != DEFAULT_FIDELITY:
+            return list(reduceTrace(steps, fidelity))
         return steps
 
 
 class CppVM(VM):
 
     @staticmethod
-    def canonicalized(output):
+    def canonicalized(output, fidelity=DEFAULT_FIDELITY):
         from . import opcodes
         valid_opcodes = opcodes.reverse_opcodes.keys()
 
         steps = []
-        for x in output:
+        for x in textLines(output):
             try:
                 if x[0:2] == "[{":
                         steps = json.loads(x)
@@ -246,7 +538,7 @@ class CppVM(VM):
             for step in steps:
                 if 'stateRoot' in step.keys():
                     if len(canon_steps): # dont log state root if no previous EVM steps
-                        canon_steps.append(step) # should happen last
+                        canon_steps.append(StateRoot(step['stateRoot'])) # should happen last
                     continue
                 if step['op'] in ['INVALID', 'STOP'] :
                     # skip STOPs
@@ -256,13 +548,8 @@ class CppVM(VM):
                     logger.info(step)
                     continue
 
-                trace_step = {
-                    'pc'  : step['pc'],
-                    'gas': '0x{0:01x}'.format(int(step['gas'])) ,
-                    'op': opcodes.reverse_opcodes[step['op']],
-                    'depth' : step['depth'],
-                    'stack' : toHexQuantities(step['stack']),
-                }
+                trace_step = Step(step['pc'], opcodes.reverse_opcodes[step['op']], int(step['gas']),
+                                  step['depth'], tuple(toHexQuantities(step['stack'])))
                 canon_steps.append(trace_step)
 
                 # Sometimes, the last one is duplicated. let's just remove that, if so
@@ -270,26 +557,28 @@ class CppVM(VM):
                 if len(canon_steps) > 1:
                     last = canon_steps[-1]
                     slast = canon_steps[-2]
-                    if slast['depth'] == last['depth'] and slast['pc'] == last['pc']:
+                    if type(slast) is Step and slast.depth == last.depth and slast.pc == last.pc:
                         canon_steps = canon_steps[:-1]
 
         except Exception as e:
             logger.info('Exception parsing cpp step:')
             logger.info(e)
 
+        if fidelity != DEFAULT_FIDELITY:
+            return list(reduceTrace(canon_steps, fidelity))
         return canon_steps
 
 class PyVM(VM):
 
     @staticmethod
-    def canonicalized(output):
+    def canonicalized(output, fidelity=DEFAULT_FIDELITY):
         from . import opcodes
 
         def formatStackItem(el):
             return '0x{0:01x}'.format(int(el.replace("b", "").replace("'", "")))
 
         def json_steps():
-            for line in output:
+            for line in textLines(output):
                 if line.startswith("tx:"):
                     continue
                 if line.startswith("tx_decoded:"):
@@ -311,7 +600,7 @@ class PyVM(VM):
             if 'stateRoot' in step.keys():
                 # dont log stateRoot when tx doesnt execute, to match cpp and parity
                 if len(canon_steps) and INCLUDE_STATEROOT:
-                    canon_steps.append(step)
+                    canon_steps.append(StateRoot(step['stateRoot']))
                 continue
             if 'event' not in step.keys():               
                 continue
@@ -324,17 +613,12 @@ class PyVM(VM):
                     # can't distinguish them from actual STOPs (that pyeth logs)
                     continue
 
-                trace_step = {
-                    'opName' : step['op'],
-                    'op'     : step['inst'],
-                    'depth'  : step['depth'],
-                    'pc'     : bstrToInt(step['pc']),
-                    'gas'    : bstrToHex(step['gas']),
-                }
-
-                trace_step['stack'] = [formatStackItem(el) for el in step['stack']]
+                trace_step = Step(bstrToInt(step['pc']), step['inst'], bstrToInt(step['gas']), step['depth'],
+                                  tuple(formatStackItem(el) for el in step['stack']))
                 canon_steps.append(trace_step)
 
+        if fidelity != DEFAULT_FIDELITY:
+            return list(reduceTrace(canon_steps, fidelity))
         return canon_steps
 
 
@@ -406,17 +690,55 @@ class GethVM(VM):
         return finishProc(self.start(**kwargs))
 
     @staticmethod
-    def canonicalized(output):
+    def splitTests(output):
+        """ Splits the output of a statetest file with several tests into the trace of each test.
+        Yields (test name, lines).
+
+        The trace of each test ends with its stateRoot. Geth executes the tests in no particular
+        order, the names are taken from the results, which are printed (as a json list) at the end
+        """
+        segments = []
+        current = []
+        summary = None
+        for line in output:
+            if summary is not None:
+                summary.append(line)
+            elif line[:1] in ("{", b"{"):
+                current.append(line)
+                if line[:12] in ('{"stateRoot"', b'{"stateRoot"'):
+                    segments.append(current)
+                    current = []
+            elif line.strip() in ("[", b"["):
+                summary = [line]
+        names = []
+        if summary is not None:
+            try:
+                names = [r['name'] for r in json.loads(b"".join(l if type(l) is bytes else l.encode() for l in summary))]
+            except Exception as e:
+                logger.warning("Failed to parse the geth statetest results: %s" % e)
+        if len(names) != len(segments):
+            logger.warning("Got %d geth results for %d traces" % (len(names), len(segments)))
+        for (name, lines) in zip(names, segments):
+            yield (name, lines)
+
+    @staticmethod
+    def canonicalized(output, fidelity=DEFAULT_FIDELITY):
         from . import opcodes
+        level = fidelityLevel(fidelity)
         addendum = []
+        gasUsed = None
         counter = 0
         for line in output:
             if len(line) == 0:
                 continue
+            if not level.steps and _isStepLine(line):
+                # Not compared, so don't bother decoding it
+                counter = counter + 1
+                continue
             step = None
-            if line[0] == "{":
+            if line[:1] in ("{", b"{"):
                 try:
-                    step = json.loads(line)
+                    step = fastjson.loads(line)
                 except Exception as e:
                     logger.warn('Exception [1] parsing geth output:')
                     traceback.print_exc(file=sys.stdout)
@@ -429,9 +751,12 @@ class GethVM(VM):
                 # don't log stateRoot when tx doesnt execute, to match cpp and parity
                 # should be last step
                 if INCLUDE_STATEROOT:
-                    addendum.append(step)
+                    addendum.append(StateRoot(step['stateRoot']))
                 continue
 
+            if not level.steps and 'gasUsed' in step.keys():
+                gasUsed = GasUsed(toGas(step['gasUsed']))
+
             # Ignored for now
             if 'error' in step.keys() and 'output' in step.keys():
                 continue
@@ -450,21 +775,23 @@ class GethVM(VM):
             if step['opName'] == "" or step['op'] not in opcodes.opcodes:
                 # invalid opcode
                 continue
-            trace_step = {
-                'pc'  : step['pc'],
-                'gas': step['gas'],
-                'op': step['op'],
-                # we want a 0-based depth
-                'depth' : step['depth'] -1,
-                'stack' : step['stack'],
-            }
-            yield trace_step
+            # we want a 0-based depth
+            if level.memory:
+                yield Step(step['pc'], step['op'], toGas(step['gas']), step['depth'] - 1, tuple(step['stack']),
+                           step.get('memory'))
+            elif level.stack:
+                yield Step(step['pc'], step['op'], toGas(step['gas']), step['depth'] - 1, tuple(step['stack']))
+            else:
+                yield Step(step['pc'], step['op'], toGas(step['gas']) if level.gas else 0, step['depth'] - 1, ())
             counter = counter +1
 
-
         # Stateroot is no in the 'addendum'. However, if there was no execution, then parity won't display the poststate root, 
         # so we only include it here if there was any actual opcodes processed. 
-        if counter > 0:
+        # When only the stateRoot is compared, the steps are not counted, and the root is
+        # always included
+        if counter > 0 or not level.steps:
+            if gasUsed is not None:
+                yield gasUsed
             for step in addendum:
                 yield step
 #            return canon_steps+addendum
@@ -544,19 +871,41 @@ class ParityVM(VM):
         return finishProc(self.start(**kwargs))
 
     @staticmethod
-    def canonicalized(output):
+    def splitTests(output):
+        """ Splits the output of a statetest file with several tests into the trace of each test.
+        Yields (test name, lines). The trace of each test starts with its name
+        """
+        name = None
+        lines = []
+        for line in output:
+            if line[:19] in ('{"action":"starting', b'{"action":"starting'):
+                if name is not None:
+                    yield (name, lines)
+                name = json.loads(line)['test']
+                lines = []
+            lines.append(line)
+        if name is not None:
+            yield (name, lines)
+
+    @staticmethod
+    def canonicalized(output, fidelity=DEFAULT_FIDELITY):
         from . import opcodes
+        level = fidelityLevel(fidelity)
         canon_steps = []
         addendum = []
+        gasUsed = None
         counter = 0
         #outputiterator = iter(output)
         for line in output:
             if len(line) == 0:
                 continue
+            if not level.steps and _isStepLine(line):
+                # Not compared, so don't bother decoding it
+                continue
             p_step = None
-            if line[0] == "{":
+            if line[:1] in ("{", b"{"):
                 try:
-                    p_step = json.loads(line)
+                    p_step = fastjson.loads(line)
                 except Exception as e:
                     logger.warn('Exception [1] parsing parity output:')
                     logger.warn(e)
@@ -572,9 +921,12 @@ class ParityVM(VM):
                 # dont log the stateRoot for basic tx's (that have no EVM steps)
                 # should be last step
                 if len(canon_steps) and INCLUDE_STATEROOT:
-                    addendum.append(step)
+                    addendum.append(StateRoot(p_step['stateRoot']))
                 continue
 
+            if not level.steps and 'gasUsed' in p_step.keys():
+                gasUsed = GasUsed(toGas(p_step['gasUsed']))
+
             # Ignored for now
             if 'error' in p_step.keys() or 'output' in p_step.keys():
                 # Except if the error is due to missing stateroot:
@@ -583,7 +935,7 @@ class ParityVM(VM):
                 if 'error' in p_step.keys() and INCLUDE_STATEROOT:
                     matcher = ParityVM.staterooterr.search(p_step['error'])
                     if matcher :
-                        addendum.append({'stateRoot' : matcher.group('stateroot')})
+                        addendum.append(StateRoot(matcher.group('stateroot')))
 
                 continue
 
@@ -597,22 +949,23 @@ class ParityVM(VM):
             if p_step['opName'] == "" or p_step['op'] not in opcodes.opcodes:
                 # invalid opcode
                 continue
-            trace_step = {
-                'pc'  : p_step['pc'],
-                'gas': p_step['gas'],
-                'op': p_step['op'],
-                # parity depth starts at 1, but we want a 0-based depth
-                'depth' : p_step['depth'] -1,
-                'stack' : p_step['stack'],
-            }
-            yield trace_step
+            # parity depth starts at 1, but we want a 0-based depth
+            if level.memory:
+                yield Step(p_step['pc'], p_step['op'], toGas(p_step['gas']), p_step['depth'] - 1, tuple(p_step['stack']),
+                           p_step.get('memory'))
+            elif level.stack:
+                yield Step(p_step['pc'], p_step['op'], toGas(p_step['gas']), p_step['depth'] - 1, tuple(p_step['stack']))
+            else:
+                yield Step(p_step['pc'], p_step['op'], toGas(p_step['gas']) if level.gas else 0, p_step['depth'] - 1, ())
             counter = counter +1
 
 
         # Stateroot is no in the 'addendum'. However, if there was no execution, then parity won't display the poststate root, 
         # so we only include it here if there was any actual opcodes processed. 
-
-        if counter > 0:
+        # When only the stateRoot is compared, the steps are not counted, and it's always included
+        if counter > 0 or not level.steps:
+            if gasUsed is not None:
+                yield gasUsed
             for step in addendum:
                 yield step
 
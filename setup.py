@@ -34,6 +34,8 @@ setup(name='Evmlab',
       # for pypi.org; empty because we do not ship Readme.md with the package. may otherwise fail on install
       long_description_content_type='text/markdown',  # requires twine and recent setuptools
       packages=find_packages(),
+      # namedtuple defaults, asyncio.run and the ProcessPoolExecutor initializer (fuzzer)
+      python_requires=">=3.7",
       package_data={'evmlab.tools.reproducer': ["templates/*"]},
       install_requires=["requests",
                         "web3",
@@ -44,5 +46,7 @@ setup(name='Evmlab',
                       "abidecoder": ["ethereum-input-decoder"],
                       "docker": ["docker==3.0.0"],
                       "fuzztests": ["docker==3.0.0", "evmcodegen"],
+                      "fastjson": ["orjson"],
+                      "numpy": ["numpy"],
                       }
       )
@@ -0,0 +1,412 @@
+import os
+import sys
+import json
+import shlex
+import time
+import tempfile
+import shutil
+import argparse
+import unittest
+import multiprocessing
+import concurrent.futures
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "utilities"))
+import fuzzer
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "files", "fixtures")
+
+
+def idle(*args):
+    return (0.0, 0.0, 0.0)
+
+
+class ConcurrencyControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(fuzzer.os, "getloadavg", idle)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_clamped(self):
+        self.assertEqual(fuzzer.ConcurrencyController(initial=100, maximum=10).limit, 10)
+        self.assertEqual(fuzzer.ConcurrencyController(initial=0, maximum=10, minimum=2).limit, 2)
+
+    def test_additive_increase(self):
+        controller = fuzzer.ConcurrencyController(initial=2, maximum=4)
+        # raised by one after `limit` tests without congestion
+        controller.onCompleted(1.0)
+        self.assertEqual(controller.limit, 2)
+        controller.onCompleted(1.0)
+        self.assertEqual(controller.limit, 3)
+        for _ in range(3):
+            controller.onCompleted(1.0)
+        self.assertEqual(controller.limit, 4)
+        for _ in range(10):
+            controller.onCompleted(1.0)
+        self.assertEqual(controller.limit, 4)
+
+    def test_multiplicative_decrease(self):
+        controller = fuzzer.ConcurrencyController(initial=8, maximum=8)
+        with mock.patch.object(fuzzer.time, "time", return_value=100.0):
+            controller.onCompleted(1.0, queueDepth=3)
+            self.assertEqual(controller.limit, 4)
+            # at most once per test latency
+            controller.onCompleted(1.0, queueDepth=3)
+            self.assertEqual(controller.limit, 4)
+        with mock.patch.object(fuzzer.time, "time", return_value=102.0):
+            controller.onCompleted(1.0, queueDepth=3)
+            self.assertEqual(controller.limit, 2)
+
+    def test_minimum(self):
+        controller = fuzzer.ConcurrencyController(initial=4, maximum=8, minimum=3)
+        controller.onCompleted(1.0, queueDepth=3)
+        self.assertEqual(controller.limit, 3)
+
+    def test_congestion(self):
+        controller = fuzzer.ConcurrencyController(initial=8, maximum=8)
+        controller.onCompleted(1.0)
+        self.assertIsNone(controller.congestion(0))
+        self.assertIn("queue depth", controller.congestion(3))
+        with mock.patch.object(fuzzer.os, "getloadavg", return_value=(controller.cpus + 1.0, 0.0, 0.0)):
+            self.assertIn("load", controller.congestion(0))
+        # the moving average rises above twice the baseline
+        controller.onCompleted(10.0)
+        self.assertIn("latency", controller.congestion(0))
+        self.assertEqual(controller.limit, 4)
+
+
+class ProcessTracesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.settings = fuzzer.TraceSettings(history=10, tail=5, digest_checkpoint=100,
+                                             backend="python", fidelity="full-stack")
+        self.locations = [(client, os.path.join(FIXTURES, "example", "%s.trace.log" % client))
+                          for client in ("geth", "parity")]
+        # a parity trace which differs in the stack of one step
+        with open(self.locations[1][1], "rb") as f:
+            differing = os.path.join(self.tmp, "parity.trace.log")
+            with open(differing, "wb") as out:
+                out.write(f.read().replace(b'"0xa4"', b'"0xa5"', 1))
+        self.differing = [self.locations[0], ("parity", differing)]
+
+    def test_pool(self):
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                                                      mp_context=multiprocessing.get_context("spawn"),
+                                                      initializer=fuzzer._init_postprocess_worker)
+        self.addCleanup(pool.shutdown)
+        for locations in (self.locations, self.differing):
+            expected = fuzzer.process_traces(locations, self.settings, forceSave=True)
+            result = pool.submit(fuzzer.process_traces, locations, self.settings, forceSave=True).result()
+            self.assertEqual(result._replace(pTime=0), expected._replace(pTime=0))
+        self.assertTrue(fuzzer.process_traces(self.locations, self.settings).equivalent)
+        self.assertFalse(expected.equivalent)
+        self.assertIn("0xa5", "".join(expected.trace_output))
+
+
+def newConfig(test, **settings):
+    """ A Config with a local geth, and its directories in a temporary directory """
+    tmp = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, tmp)
+    settings = dict({"clients": "geth", "geth.binary": "evm", "fork_config": "Byzantium",
+                     "artefacts": tmp + "/artefacts", "tests_path": tmp + "/tests"}, **settings)
+    configfile = os.path.join(tmp, "statetests.ini")
+    with open(configfile, "w") as f:
+        f.write("[DEFAULT]\n%s\n[statetest]\n[codegen]\n" % "\n".join("%s = %s" % kv for kv in settings.items()))
+    return fuzzer.Config(argparse.Namespace(configfile=configfile, set_config=[]))
+
+
+class ExchangePathTest(unittest.TestCase):
+
+    def config(self, exchange_path):
+        with mock.patch.object(fuzzer.atexit, "register") as register:
+            config = newConfig(self, exchange_path=exchange_path)
+        return (config, register)
+
+    @unittest.skipUnless(os.path.isdir("/dev/shm"), "no /dev/shm")
+    def test_shm(self):
+        (config, register) = self.config("shm")
+        self.assertTrue(config.exchange_path.startswith("/dev/shm/"))
+        self.assertTrue(os.path.isdir(config.testfilesPath))
+        # removed on exit
+        ((func, path), kwargs) = register.call_args
+        self.assertEqual(path, config.exchange_path)
+        func(path, **kwargs)
+        self.assertFalse(os.path.exists(config.exchange_path))
+
+    def test_save_artefacts(self):
+        (config, register) = self.config(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, config.exchange_path)
+        register.assert_not_called()
+        t = fuzzer.RawStateTest({"randomStatetestt1": {}}, "t1", "pool_0", config)
+        t.writeToFile()
+        t.procs = [({'cmd': "evm"}, "geth")]
+        with open(t.tempTraceLocation("geth"), "w") as f:
+            f.write("trace")
+        t.storeTrace("geth", "evm")
+        t.saveArtefacts()
+        # moved from the exchange path
+        self.assertEqual(os.listdir(config.testfilesPath) + os.listdir(config.logfilesPath), [])
+        self.assertEqual(sorted(os.listdir(config.artefacts)), ["pool_0", "pool_0-geth.trace.log"])
+        self.assertEqual(t.traceLocations(), [("geth", "%s/pool_0-geth.trace.log" % config.artefacts)])
+        # a test executed in a batch has no file of its own, it's written to the artefacts
+        t = fuzzer.RawStateTest({"randomStatetestt2": {}}, "t2", "pool_1", config)
+        t.saveArtefacts()
+        with open(os.path.join(config.artefacts, "pool_1")) as f:
+            self.assertEqual(json.load(f), {"randomStatetestt2": {}})
+
+
+class GeneratorProcessesTest(unittest.TestCase):
+
+    def test_shared_file_pool(self):
+        ctx = multiprocessing.get_context("spawn")
+        pool = fuzzer.SharedFilePool(ctx, 5)
+        self.assertEqual([pool.get(), pool.get()], ["pool_5", "pool_6"])
+        # the counter is shared with the generators
+        p = ctx.Process(target=pool.get)
+        p.start()
+        p.join()
+        self.assertEqual(pool.get(), "pool_8")
+        pool.put("pool_6")
+        while pool.frees.empty():
+            time.sleep(0.01)
+        self.assertEqual(pool.get(), "pool_6")
+
+    def test_generate_tests(self):
+        config = newConfig(self, generator_workers=2, generator_seed=1)
+        f = fuzzer.Fuzzer(config)
+        self.addCleanup(lambda: [p.terminate() for p in multiprocessing.active_children()])
+        with mock.patch.object(fuzzer, "fPool", fuzzer.FilePool()):
+            tests = [t for (i, t) in zip(range(6), f.generate_tests())]
+            self.assertIsInstance(fuzzer.fPool, fuzzer.SharedFilePool)
+        # the counters of the generators are interleaved, each generator counts from its number
+        for worker in range(2):
+            numbers = sorted(t.number for t in tests if t.number % 2 == worker)
+            self.assertEqual(numbers, list(range(worker, 2 * len(numbers), 2)))
+        self.assertEqual(len(set(t.filename for t in tests)), 6)
+        for t in tests:
+            with open(t.fullfilename) as fd:
+                self.assertEqual(json.load(fd), t.statetest)
+            self.assertEqual(t.name, fuzzer.StateTest.testname(config, t.number))
+        self.assertEqual(len(f.generated), 2)
+        self.assertGreaterEqual(sum(f.generated), 6)
+
+
+class FuzzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.config = SimpleNamespace(client_replicas=3, replica_scheduling="least-loaded",
+                                      trace_fidelity="full-stack", screening=True, clientNames=["geth", "parity"],
+                                      testfilesPath=self.tmp + "/testfiles/", logfilesPath=self.tmp + "/logs/",
+                                      exchange_path=self.tmp)
+        for m in ("replicaTestfilesPath", "replicaLogfilesPath"):
+            setattr(self.config, m, getattr(fuzzer.Config, m).__get__(self.config))
+        for replica in range(self.config.client_replicas):
+            os.makedirs(self.config.replicaTestfilesPath(replica), exist_ok=True)
+            os.makedirs(self.config.replicaLogfilesPath(replica), exist_ok=True)
+        self.fuzzer = fuzzer.Fuzzer.__new__(fuzzer.Fuzzer)
+        self.fuzzer._config = self.config
+        self.fuzzer.replicaLoad = [0] * self.config.client_replicas
+        self.fuzzer._scheduled = 0
+
+    def newTest(self, name):
+        t = fuzzer.RawStateTest({"randomStatetest" + name: {}}, name, name, self.config)
+        t.writeToFile()
+        return t
+
+    def test_schedule_least_loaded(self):
+        self.fuzzer.replicaLoad = [2, 0, 1]
+        t = self.newTest("t1")
+        self.fuzzer.schedule(t)
+        self.assertEqual(t.replica, 1)
+        self.assertTrue(os.path.exists(t.fullfilename))
+        self.assertEqual(self.fuzzer.replicaLoad, [2, 1, 1])
+        self.fuzzer.schedule(self.newTest("t2"))
+        self.assertEqual(self.fuzzer.replicaLoad, [2, 2, 1])
+
+    def test_schedule_round_robin(self):
+        self.config.replica_scheduling = "round-robin"
+        self.fuzzer.replicaLoad = [5, 0, 0]
+        replicas = []
+        for i in range(4):
+            t = self.newTest("t%d" % i)
+            self.fuzzer.schedule(t)
+            replicas.append(t.replica)
+        self.assertEqual(replicas, [0, 1, 2, 0])
+
+    def test_move_to_replica(self):
+        t = self.newTest("t1")
+        self.fuzzer.replicaLoad = [1, 1, 0]
+        self.fuzzer.schedule(t)
+        self.assertEqual(t.replica, 2)
+        self.assertEqual(os.listdir(self.config.replicaTestfilesPath(0)), [])
+        self.assertEqual(os.listdir(self.config.replicaTestfilesPath(2)), ["t1"])
+        self.assertEqual(os.path.dirname(t.tempTraceLocation("geth")),
+                         os.path.abspath(self.config.replicaLogfilesPath(2)))
+        # a test is moved from the replica it was executed on, once it's executed again
+        t.socketData = b"spurious"
+        self.fuzzer.end_processes(t)
+        self.assertEqual(self.fuzzer.replicaLoad, [1, 1, 0])
+        self.fuzzer.replicaLoad = [0, 1, 1]
+        self.fuzzer.schedule(t)
+        self.assertEqual(os.listdir(self.config.replicaTestfilesPath(2)), [])
+        self.assertTrue(os.path.exists(os.path.join(self.config.replicaTestfilesPath(0), "t1")))
+
+    def test_prepare(self):
+        t = self.newTest("t1")
+        with open(t.tempTraceLocation("geth"), "w") as f:
+            f.write("trace of an earlier test")
+        self.fuzzer.prepare(t)
+        self.assertEqual(t.fidelity, "stateroot-only")
+        self.assertFalse(os.path.exists(t.tempTraceLocation("geth")))
+
+    def test_rerun(self):
+        t = self.newTest("t1")
+        self.fuzzer.prepare(t)
+        passed = SimpleNamespace(equivalent=True)
+        failed = SimpleNamespace(equivalent=False)
+        self.assertFalse(self.fuzzer.needsRerun(t, passed))
+        self.assertTrue(self.fuzzer.needsRerun(t, passed, forceSave=True))
+        self.assertTrue(self.fuzzer.needsRerun(t, failed))
+        os.remove(t.fullfilename)
+        t.procs = [({'cmd': "evm"}, "geth")]
+        t.traceFiles = ["pool_0-geth.trace.log"]
+        self.fuzzer.prepareRerun(t)
+        self.assertEqual(t.fidelity, "full-stack")
+        self.assertEqual((t.procs, t.traceFiles), ([], []))
+        self.assertTrue(os.path.exists(t.fullfilename))
+        self.assertFalse(self.fuzzer.needsRerun(t, failed))
+
+    def test_unbatch(self):
+        t = self.newTest("t1")
+        self.assertEqual(self.fuzzer.unbatch(t), [t])
+
+        tests = [self.newTest("t1"), self.newTest("t2")]
+        batch = fuzzer.StateTestBatch(tests, "batch", self.config)
+        batch.fidelity = "full-stack"
+        batch.socketData = b""
+        batch.socketEvent = ""
+        batch.procs = [({'cmd': "evm"}, "geth")]
+        with open(os.path.join(FIXTURES, "example", "geth.trace.log"), "rb") as f:
+            trace = f.read()
+        traces = {"t1": trace, "t2": trace.replace(b"50d858e0", b"60d858e0")}
+        with open(batch.tempTraceLocation("geth"), "wb") as f:
+            # geth executes the tests in no particular order, the results name them
+            results = [{"name": "randomStatetestt2"}, {"name": "randomStatetestt1"}]
+            f.write(traces["t2"] + traces["t1"] + json.dumps(results, indent=2).encode())
+        batch.storeTrace("geth", "evm")
+        with mock.patch.object(fuzzer, "fPool", fuzzer.FilePool()):
+            self.assertEqual(self.fuzzer.unbatch(batch), tests)
+        for t in tests:
+            self.assertEqual(t.fidelity, "full-stack")
+            self.assertEqual(t.traceLocations(), [("geth", t.tempTraceLocation("geth"))])
+            with open(t.tempTraceLocation("geth"), "rb") as f:
+                self.assertEqual(f.read(), traces[t.id])
+
+    def test_testeth_commands(self):
+        t = self.newTest("t1")
+        t.fidelity = "full-stack"
+        commands = {}
+        self.fuzzer.execClient = lambda client_name, test, cmd, **kw: commands.setdefault(client_name, cmd)
+        self.fuzzer.startCpp(t)
+        self.fuzzer.startHera(t)
+        for cmd in commands.values():
+            self.assertIn("/testfiles/t1", cmd)
+            self.assertEqual(cmd[cmd.index("/testfiles/t1") + 1], "randomStatetestt1")
+        self.assertEqual(sorted(commands), ["cpp", "hera"])
+
+    def test_commands(self):
+        self.config.active_clients = [(name, True, None) for name in ("geth", "cpp", "parity", "hera")]
+        self.config.binaries = {}
+        self.config.containerName = lambda client_name, replica: "%s-%d" % (client_name, replica)
+        t = self.newTest("t1")
+        self.fuzzer.prepare(t)
+        commands = self.fuzzer.commands(t)
+        self.assertEqual([c[0] for c in commands], ["geth", "cpp", "parity", "hera"])
+        for (client_name, container, cmd, trace) in commands:
+            self.assertEqual(container, "%s-%d" % (client_name, t.replica))
+            self.assertIn("/testfiles/t1", cmd)
+            self.assertEqual(trace, t.tempTraceFilename(client_name))
+
+    def test_local_cpp_command(self):
+        # testeth prints its arguments, as it gets them
+        testeth = os.path.join(self.tmp, "testeth")
+        with open(testeth, "w") as f:
+            f.write('#!/bin/sh\nfor a in "$@"; do echo "$a"; done\n')
+        os.chmod(testeth, 0o755)
+        self.config.binaries = {"cpp": testeth}
+        self.config.containerName = lambda client_name, replica: "cpp-%d" % replica
+        t = self.newTest("t1")
+        self.fuzzer.prepare(t)
+        t.fidelity = "full-stack"
+        self.fuzzer.workers = []
+        proc_info = self.fuzzer.startCpp(t)
+        self.assertIsInstance(proc_info["output"], fuzzer.LocalProcess)
+        proc_info["output"].close()
+        with open(t.tempTraceLocation("cpp")) as f:
+            args = f.read().splitlines()
+        self.assertEqual(args[args.index("--singletest") + 1:args.index("--singletest") + 3],
+                         [self.config.replicaTestfilesPath(t.replica) + "t1", "randomStatetestt1"])
+        jsontrace = json.loads(args[args.index("--jsontrace") + 1])
+        self.assertEqual((jsontrace["disableStack"], jsontrace["disableMemory"]), (False, True))
+        # the same arguments, once the command is joined for a shell
+        cmd = self.fuzzer.cppCommand(t)
+        self.assertEqual(shlex.split(fuzzer.Fuzzer.shWrap(cmd, "t1-cpp.trace.log")[2])[:len(cmd)], cmd)
+        worker = fuzzer.ClientWorker("cpp-%d" % t.replica, logs=self.config.replicaLogfilesPath(t.replica))
+        self.addCleanup(worker.stop)
+        self.fuzzer.workers = [worker]
+        self.fuzzer.startCpp(t)
+        while not worker.finished():
+            pass
+        with open(t.tempTraceLocation("cpp")) as f:
+            self.assertEqual(f.read().splitlines(), args)
+
+class ClientWorkerTest(unittest.TestCase):
+
+    def test_finished(self):
+        logs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, logs)
+        worker = fuzzer.ClientWorker("local", logs=logs)
+        self.addCleanup(worker.stop)
+        worker.send(["echo", "hello"], "t1.trace.log")
+        worker.send(["echo", "world"], "t2.trace.log")
+        self.assertEqual(worker.pending, 2)
+        finished = []
+        while len(finished) < 2:
+            finished.extend(worker.finished())
+        self.assertEqual(finished, ["t1.trace.log", "t2.trace.log"])
+        self.assertEqual(worker.pending, 0)
+        with open(os.path.join(logs, "t2.trace.log")) as f:
+            self.assertEqual(f.read(), "world\n")
+        worker.proc.stdin.close()
+        self.assertIsNone(worker.finished())
+
+    def test_execTest(self):
+        logs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, logs)
+        f = fuzzer.Fuzzer.__new__(fuzzer.Fuzzer)
+        f.workers = []
+        self.addCleanup(lambda: [w.stop() for w in f.workers])
+        busy = f.start_worker("geth-0", logs=logs)
+        idle = f.start_worker("geth-0", logs=logs)
+        other = f.start_worker("parity-0", logs=logs)
+        busy.pending = 1
+        # sent to the least busy worker of the container, the error output goes to the trace as well
+        self.assertIs(f.execTest("geth-0", ["ls", "/nonexistent"], "t1.trace.log")["worker"], idle)
+        while not idle.finished():
+            pass
+        with open(os.path.join(logs, "t1.trace.log")) as fd:
+            self.assertIn("nonexistent", fd.read())
+        self.assertEqual(other.pending, 0)
+        # a worker which exited is replaced, with the same logs directory
+        idle.proc.stdin.close()
+        self.assertIsNone(idle.finished())
+        worker = f.start_worker("geth-0", replaces=idle)
+        self.assertEqual(worker.logs, logs)
+        self.assertEqual(f.workers, [busy, other, worker])
+
@@ -0,0 +1,244 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from evmlab import vm, fastjson, tracearray
+
+GETH_TRACE = os.path.join(os.path.dirname(__file__), "..", "files", "example_trace.txt")
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "files", "fixtures")
+
+
+class CompareTracesTest(unittest.TestCase):
+
+    def test_equivalent(self):
+        a = ["step %d" % i for i in range(10)]
+        (equivalent, output) = vm.compare_traces([iter(a), iter(list(a))], ["a", "b"])
+        self.assertTrue(equivalent)
+        self.assertEqual(len(output), 10)
+        self.assertTrue(all(line.startswith("[*]") for line in output))
+
+    def test_diff(self):
+        a = ["step %d" % i for i in range(10)]
+        b = list(a)
+        b[5] = "other"
+        (equivalent, output) = vm.compare_traces([a, b], ["a", "b"])
+        self.assertFalse(equivalent)
+        self.assertEqual(output[5], "[!!]       a step 5")
+        self.assertEqual(output[6], "[!!]       b other")
+        self.assertEqual(len(output), 11)
+
+    def test_history_and_tail(self):
+        a = ["step %d" % i for i in range(1000)]
+        b = list(a)
+        b[500] = "other"
+        consumed = []
+
+        def track(steps):
+            for step in steps:
+                consumed.append(step)
+                yield step
+
+        (equivalent, output) = vm.compare_traces([track(a), b], ["a", "b"], history=3, tail=2)
+        self.assertFalse(equivalent)
+        self.assertEqual(output[0], "[..]     497 equivalent steps omitted")
+        self.assertEqual(output[1:4], ["[*]          step 497", "[*]          step 498", "[*]          step 499"])
+        self.assertTrue(output[4].startswith("[!!]"))
+        self.assertEqual(output[6:], ["[*]          step 501", "[*]          step 502"])
+        # The comparison stops pulling steps after the tail window
+        self.assertLess(len(consumed), 505)
+
+    def test_history_equivalent(self):
+        a = ["step %d" % i for i in range(100)]
+        (equivalent, output) = vm.compare_traces([a, a], ["a", "b"], history=5)
+        self.assertTrue(equivalent)
+        self.assertEqual(output[0], "[..]      95 equivalent steps omitted")
+        self.assertEqual(len(output), 6)
+
+    def test_length_mismatch(self):
+        a = ["step %d" % i for i in range(3)]
+        (equivalent, output) = vm.compare_traces([a, a[:2]], ["a", "b"])
+        self.assertFalse(equivalent)
+        self.assertEqual(output[-1], "[!!]       b None")
+
+
+class CanonicalizerTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(GETH_TRACE) as f:
+            self.lines = f.read().split("\n")
+
+    def test_geth_steps(self):
+        steps = list(vm.GethVM.canonicalized(self.lines))
+        self.assertEqual(len(steps), 536)
+        self.assertEqual(steps[1], vm.Step(pc=2, op=0x60, gas=0x47b75d, depth=0, stack=("0xa4",)))
+        self.assertEqual(vm.toText(steps[1]), "pc     2 op      PUSH1( 96) gas 0x47b75d depth  0 stack ['0xa4']")
+
+    def test_compare_steps(self):
+        a = vm.GethVM.canonicalized(self.lines)
+        b = vm.GethVM.canonicalized(list(self.lines))
+        (equivalent, output) = vm.compare_traces([a, b], ["geth", "geth2"])
+        self.assertTrue(equivalent)
+        self.assertEqual(output[1], "[*]          pc     2 op      PUSH1( 96) gas 0x47b75d depth  0 stack ['0xa4']")
+
+    def test_parity_fixture(self):
+        with open(os.path.join(FIXTURES, "example", "geth.trace.log")) as f:
+            geth = list(vm.GethVM.canonicalized(f.read().split("\n")))
+        with open(os.path.join(FIXTURES, "example", "parity.trace.log")) as f:
+            parity = list(vm.ParityVM.canonicalized(f.read().split("\n")))
+        self.assertIsInstance(parity[-1], vm.StateRoot)
+        (equivalent, output) = vm.compare_traces([geth, parity], ["geth", "parity"])
+        self.assertTrue(equivalent)
+
+    def test_fidelity(self):
+        with open(os.path.join(FIXTURES, "example", "geth.trace.log")) as f:
+            lines = f.read().split("\n")
+        with open(os.path.join(FIXTURES, "example", "parity.trace.log")) as f:
+            parity = f.read().split("\n")
+        for fidelity in vm.FIDELITY_LEVELS:
+            geth = list(vm.GethVM.canonicalized(lines, fidelity=fidelity))
+            # gasUsed is only reported at stateroot-only
+            full = vm.GethVM.canonicalized(lines, fidelity="full+memory")
+            self.assertEqual([s for s in geth if type(s) is not vm.GasUsed], list(vm.reduceTrace(full, fidelity)))
+            if fidelity != "full+memory":
+                # parity does not report the memory
+                self.assertEqual(geth, list(vm.ParityVM.canonicalized(parity, fidelity=fidelity)))
+        self.assertEqual(list(vm.ParityVM.canonicalized(parity, fidelity="stateroot-only")),
+                         [vm.GasUsed(0x24529),
+                          vm.StateRoot("50d858e0985ecc7f60418aaf0cc5ab587f42c2570a884095a9e8ccacd0f6545c")])
+        self.assertEqual(vm.GethVM.canonicalized(self.lines, fidelity="ops+gas").__next__(),
+                         vm.Step(pc=0, op=0x60, gas=0x47b760, depth=0, stack=()))
+        with self.assertRaises(ValueError):
+            list(vm.GethVM.canonicalized(self.lines, fidelity="everything"))
+
+    def test_split_tests(self):
+        with open(os.path.join(FIXTURES, "example", "geth.trace.log"), "rb") as f:
+            geth = f.read().splitlines(keepends=True)
+        with open(os.path.join(FIXTURES, "example", "parity.trace.log"), "rb") as f:
+            parity = f.read().splitlines(keepends=True)
+        expected = list(vm.GethVM.canonicalized(geth))
+        # geth runs the tests in any order, and names them in the results at the end
+        results = b'[\n  {\n    "name": "b",\n    "pass": false\n  },\n  {\n    "name": "a",\n    "pass": false\n  }\n]\n'
+        split = list(vm.GethVM.splitTests(geth + geth + results.splitlines(keepends=True)))
+        self.assertEqual([name for (name, lines) in split], ["b", "a"])
+        for (name, lines) in split:
+            self.assertEqual(list(vm.GethVM.canonicalized(lines)), expected)
+        renamed = [parity[0].replace(b"randomStatetestexample", b"b")] + parity[1:]
+        split = list(vm.ParityVM.splitTests(parity + renamed))
+        self.assertEqual([name for (name, lines) in split], ["randomStatetestexample", "b"])
+        for (name, lines) in split:
+            self.assertEqual(list(vm.ParityVM.canonicalized(lines)), expected)
+
+    def test_trace_file(self):
+        fname = os.path.join(FIXTURES, "example", "geth.trace.log")
+        with open(fname) as f:
+            expected = list(vm.GethVM.canonicalized(f))
+        with vm.TraceFile(fname) as f:
+            self.assertEqual(list(vm.GethVM.canonicalized(f)), expected)
+        with vm.TraceFile(fname) as f:
+            self.assertEqual(list(vm.CppVM.canonicalized(f)), [])
+
+    def test_trace_file_lines(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"a\n\nb\nc")
+            f.flush()
+            with vm.TraceFile(f.name) as trace:
+                self.assertEqual(list(trace), [b"a\n", b"\n", b"b\n", b"c"])
+        with tempfile.NamedTemporaryFile() as f:
+            with vm.TraceFile(f.name) as trace:
+                self.assertEqual(list(trace), [])
+
+    def test_tail_file(self):
+        with open(os.path.join(FIXTURES, "example", "geth.trace.log"), "rb") as f:
+            data = f.read()
+        expected = list(vm.GethVM.canonicalized(data.decode().split("\n")))
+        finished = threading.Event()
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, "trace.log")
+
+            def write():
+                with open(fname, "wb") as f:
+                    for i in range(0, len(data), 5000):
+                        f.write(data[i:i + 5000])
+                        f.flush()
+                        time.sleep(0.001)
+                finished.set()
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            with vm.TailFile(fname, finished) as trace:
+                self.assertEqual(list(vm.GethVM.canonicalized(trace)), expected)
+            writer.join()
+
+    def test_json_backends(self):
+        default = fastjson.backend
+        try:
+            expected = None
+            for name in fastjson.backends:
+                try:
+                    fastjson.use(name)
+                except ImportError:
+                    continue
+                steps = list(vm.GethVM.canonicalized(self.lines))
+                if expected is None:
+                    expected = steps
+                self.assertEqual(steps, expected)
+        finally:
+            fastjson.use(default)
+
+
+class TraceDigestTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(GETH_TRACE) as f:
+            self.steps = list(vm.GethVM.canonicalized(f.read().split("\n")))
+
+    def test_equal(self):
+        digests = [vm.TraceDigest(100).consume(self.steps) for _ in range(3)]
+        self.assertTrue(vm.TraceDigest.equal(digests))
+        self.assertEqual(vm.TraceDigest.commonPrefix(digests), len(self.steps))
+
+    def test_checkpoints(self):
+        other = list(self.steps)
+        other[250] = other[250]._replace(gas=other[250].gas + 1)
+        digests = [vm.TraceDigest(100).consume(self.steps), vm.TraceDigest(100).consume(other)]
+        self.assertFalse(vm.TraceDigest.equal(digests))
+        self.assertEqual(vm.TraceDigest.commonPrefix(digests), 200)
+
+        (equivalent, output) = vm.compare_traces([self.steps, other], ["a", "b"], history=10, tail=0, start=200)
+        self.assertFalse(equivalent)
+        self.assertEqual(output[0], "[..]     240 equivalent steps omitted")
+        self.assertTrue(output[11].startswith("[!!]"))
+
+    def test_length(self):
+        digests = [vm.TraceDigest(100).consume(self.steps), vm.TraceDigest(100).consume(self.steps[:-1])]
+        self.assertFalse(vm.TraceDigest.equal(digests))
+
+
+@unittest.skipIf(tracearray.numpy is None, "numpy not installed")
+class TraceArraysTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(GETH_TRACE) as f:
+            self.steps = list(vm.GethVM.canonicalized(f.read().split("\n")))
+
+    def assertSameComparison(self, traces, **kwargs):
+        expected = vm.compare_traces(traces, ["a", "b"], **kwargs)
+        (equivalent, output, stats) = tracearray.compare_traces(traces, ["a", "b"], **kwargs)
+        self.assertEqual((equivalent, output), expected)
+        return stats
+
+    def test_compare(self):
+        stack = list(self.steps)
+        stack[250] = stack[250]._replace(stack=stack[250].stack + ("0x1",))
+        for other in (list(self.steps), stack, self.steps[:-1], self.steps + [vm.StateRoot("00")]):
+            self.assertSameComparison([self.steps, other], history=10, tail=3)
+            self.assertSameComparison([self.steps, other])
+        self.assertEqual(tracearray.first_difference([tracearray.TraceArrays(self.steps),
+                                                      tracearray.TraceArrays(stack)]), 250)
+
+    def test_stats(self):
+        stats = vm.Stats()
+        list(stats.traceStats(self.steps))
+        self.assertEqual(tracearray.TraceArrays(self.steps).stats(), stats.result())
+        self.assertEqual(tracearray.TraceArrays([]).stats(), vm.Stats().result())
@@ -3,6 +3,7 @@
 # Author : <github.com/tintinweb>
 
 import unittest
+import random
 import string
 import collections
 import evmdasm
@@ -70,6 +71,46 @@ class EthFillerTest(unittest.TestCase):
             self.assertNotIn("UNKNOWN", disassembly[0].name)
 
 
+    def test_codeinstr_arguments(self):
+        seen = set()
+        for seed in range(10):
+            r = rndval.RndCodeInstr(rng=random.Random(seed))
+            r.randomPercent = lambda: 0  # smart arguments only
+            code = r.generate(length=400)
+            disassembly = evmdasm.EvmBytecode(code).disassemble()
+            self.assertFalse(disassembly.errors)
+            # each PUSH is followed by its operand, none is cut off or runs into the next instruction
+            self.assertEqual(sum(1 + len(instr.operand_bytes) for instr in disassembly), len(code) // 2 - 1)
+            for i, instr in enumerate(disassembly):
+                seen.add(instr.name)
+                if instr.name.startswith("PUSH"):
+                    self.assertEqual(len(instr.operand_bytes), instr.length_of_operand)
+                elif instr.name.endswith("CALL"):
+                    # ..., address, gas
+                    args = 7 if instr.name in ("CALL", "CALLCODE") else 6
+                    self.assertTrue(all(arg.name.startswith("PUSH") for arg in disassembly[i - args:i]))
+                    self.assertIn(disassembly[i - 2].operand, r._addresses_seen)
+                elif instr.name == "SSTORE":
+                    for arg in disassembly[i - 2:i]:
+                        self.assertEqual(arg.name, "PUSH1")
+                        self.assertLessEqual(int(arg.operand, 16), 3)
+            self.assertTrue(r._addresses_seen)
+        self.assertLessEqual({"CALL", "DELEGATECALL", "SSTORE"}, seen)
+
+    def test_random_byte_sequence(self):
+        r = rndval._RndBase(rng=random.Random(1))
+        self.assertEqual(r.randomByteSequence(0), bytearray())
+        data = r.randomByteSequence(100000)
+        self.assertEqual(len(data), 100000)
+        # uniformly distributed, as the bytes drawn one by one
+        counter = collections.Counter(data)
+        self.assertEqual(len(counter), 256)
+        self.assertTrue(all(300 < n < 500 for n in counter.values()))
+        # and derived from the seed, the same as random.randbytes (python 3.9)
+        self.assertEqual(rndval._RndBase(rng=random.Random(1)).randomByteSequence(100000), data)
+        if hasattr(random.Random, "randbytes"):
+            self.assertEqual(bytes(data), random.Random(1).randbytes(100000))
+
     def _test_hex_cls(self, cls=rndval.RndHexInt, _min=0, _max=2 ** 64 - 1):
         min_chars = len(rndval.hex2(_min))
         max_chars = len(rndval.hex2(_max))
@@ -190,3 +231,36 @@ class EthFillerTest(unittest.TestCase):
     def test_gasprice(self):
         self._test_hex_cls(cls=rndval.RndGasPrice,
                            _min=0, _max=10)
+
+
+class WeightedRandomizerTest(unittest.TestCase):
+
+    def test_random(self):
+        rnd = rndval.base.WeightedRandomizer({"a": 1, "b": 0, "c": 3})
+        counter = collections.Counter(rnd.random() for _ in range(4000))
+        self.assertNotIn("b", counter)
+        self.assertTrue(2 < counter["c"] / counter["a"] < 4)
+
+    def test_sample(self):
+        rnd = rndval.base.WeightedRandomizer({"a": 1, "b": 0, "c": 3})
+        counter = collections.Counter(rnd.sample(4000))
+        self.assertEqual(sum(counter.values()), 4000)
+        self.assertNotIn("b", counter)
+        self.assertTrue(2 < counter["c"] / counter["a"] < 4)
+        self.assertEqual(rndval.base.WeightedRandomizer({"a": 1}).sample(3), ["a", "a", "a"])
+
+    def test_sample_distribution(self):
+        # the same distribution as drawing the values one by one
+        weights = rndval.RndCodeBytes.LIKELYHOOD_BY_OPCODE_INT
+        rnd = rndval.base.WeightedRandomizer(weights, rng=random.Random(1))
+        sampled = collections.Counter(rnd.sample(100000))
+        drawn = collections.Counter(rnd.random() for _ in range(100000))
+        total = sum(weights.values())
+        for (value, weight) in weights.items():
+            if weight / total > 0.01:
+                self.assertAlmostEqual(sampled[value] / 100000, weight / total, delta=0.005)
+                self.assertAlmostEqual(drawn[value] / 100000, weight / total, delta=0.005)
+        self.assertLessEqual(set(sampled), set(weights))
+        # and derived from the seed
+        self.assertEqual(rndval.base.WeightedRandomizer(weights, rng=random.Random(2)).sample(100),
+                         rndval.base.WeightedRandomizer(weights, rng=random.Random(2)).sample(100))
@@ -4,19 +4,27 @@
 Executes state tests on multiple clients, checking for EVM trace equivalence
 
 """
-import json, sys, os, time, collections, shutil
+import json, sys, os, time, collections, shutil, random
 import configparser, getpass
-import signal
+import signal, atexit
 import argparse, queue, threading
-import select
-import docker
+import concurrent.futures, multiprocessing
+import asyncio, functools
+import select, re, shlex
+import subprocess
 import logging
 
 from evmlab import vm as VMUtils
+from evmlab import tracearray
 from evmlab.tools.statetests.templates import statetest
 
 logger = logging.getLogger(__name__)
 
+try:
+    import docker
+except ImportError:
+    docker = None
+
 class FilePool(object):
     """This implements a little pool of filenames, so we can reuse files instead of constantly
     creating and deleting files.
@@ -39,6 +47,28 @@ class FilePool(object):
         self.frees.append(f)
 
 
+class SharedFilePool(FilePool):
+    """ A FilePool shared between the processes which generate tests (see Fuzzer.generate_tests),
+    and the fuzzer, which returns the files of the executed tests
+    """
+    def __init__(self, ctx, counter=0):
+        self.counter = ctx.Value('l', counter)
+        self.frees = ctx.Queue()
+
+    def get(self):
+        try:
+            return self.frees.get_nowait()
+        except queue.Empty:
+            pass
+        with self.counter.get_lock():
+            n = "pool_%d" % self.counter.value
+            self.counter.value = self.counter.value + 1
+        return n
+
+    def put(self, f):
+        self.frees.put(f)
+
+
 fPool= FilePool()
 
 class Config(object):
@@ -69,6 +99,9 @@ class Config(object):
                 self.active_clients.append((c, True, self._config[uname][key]))
 
 
+        # The clients which are executed locally, name -> path of the binary
+        self.binaries = {name: path for (name, isDocker, path) in self.active_clients if not isDocker}
+
         self.fork_config = self._config.get(uname, 'fork_config', fallback="")
 
         def resolve(path):
@@ -108,6 +141,74 @@ class Config(object):
         self.enable_reporting = self._config.get(uname, 'enable_reporting', fallback=False)
         self.docker_force_update_image = self._config.get(uname, 'docker_force_update_image', fallback=None)
 
+        # How many equivalent steps to keep in front of the first difference, and how many
+        # steps to compare after it before we stop parsing the traces
+        self.compare_history = self._config.getint(uname, 'compare_history', fallback=1000)
+        self.compare_tail = self._config.getint(uname, 'compare_tail', fallback=50)
+        # Traces are folded into digests, with a checkpoint every x steps, so passing
+        # tests are never compared step by step. 0 = always compare step by step
+        self.digest_checkpoint = self._config.getint(uname, 'digest_checkpoint', fallback=1000)
+        # python: compare the traces step by step, while parsing them
+        # numpy: load the traces into arrays and find the first difference with numpy. Faster
+        # for very long traces, but the traces are held in memory. Digests are not used
+        self.compare_backend = self._config.get(uname, 'compare_backend', fallback="python")
+        if self.compare_backend == "numpy" and tracearray.numpy is None:
+            logger.warning("numpy not installed, falling back to compare_backend = python. run `#> pip install evmlab[numpy]` to install.")
+            self.compare_backend = "python"
+        # Number of processes which canonicalize and compare the traces. 0 = process the traces
+        # in the main loop
+        self.postprocess_workers = self._config.getint(uname, 'postprocess_workers', fallback=0)
+        # Compare the traces while the clients are running, and kill the clients which are
+        # still running once the traces differ. Takes precedence over postprocess_workers
+        self.compare_while_running = self._config.getboolean(uname, 'compare_while_running', fallback=False)
+        # Number of processes which generate the tests. 0 = a thread of the fuzzer generates them.
+        # The template of the tests (of each process) is seeded from generator_seed (random, if not set)
+        self.generator_workers = self._config.getint(uname, 'generator_workers', fallback=0)
+        self.generator_seed = self._config.getint(uname, 'generator_seed', fallback=None)
+        # Execute the tests on an asyncio event loop (see AsyncTestExecutor)
+        self.async_executor = self._config.getboolean(uname, 'async_executor', fallback=False)
+        # What the clients trace, and what is compared: see VMUtils.FIDELITY_LEVELS
+        self.trace_fidelity = self._config.get(uname, 'trace_fidelity', fallback=VMUtils.DEFAULT_FIDELITY)
+        if VMUtils.fidelityLevel(self.trace_fidelity).memory and "parity" in self.clientNames:
+            # parity does not report the memory, so every test would fail
+            raise ValueError("trace_fidelity %s is not supported by parity" % self.trace_fidelity)
+        # Screen all tests at the stateroot-only fidelity (stateRoot and gasUsed), and re-run only
+        # the tests which fail the screening at the trace_fidelity, to produce the artefacts
+        self.screening = self._config.getboolean(uname, 'screening', fallback=False)
+        # Number of long-lived shells per client container which execute the tests (see ClientWorker).
+        # 0 = a docker exec per test and client
+        self.client_workers = self._config.getint(uname, 'client_workers', fallback=0)
+        # Number of containers per client. Each replica has its own testfiles and logs directories,
+        # tests are scheduled to the replicas either least-loaded or round-robin
+        self.client_replicas = self._config.getint(uname, 'client_replicas', fallback=1)
+        self.replica_scheduling = self._config.get(uname, 'replica_scheduling', fallback="least-loaded")
+        if self.replica_scheduling not in ("least-loaded", "round-robin"):
+            raise ValueError("Unknown replica_scheduling %s" % self.replica_scheduling)
+        # The max number of tests in flight per replica. With adaptive_concurrency, the number of tests in
+        # flight is adjusted to the latency of the tests and the load of the host, up to max_parallel
+        self.max_parallel = self._config.getint(uname, 'max_parallel', fallback=50)
+        self.adaptive_concurrency = self._config.getboolean(uname, 'adaptive_concurrency', fallback=True)
+        # Number of tests which are written into one statetest file, and executed with one invocation
+        # of each client. The traces are split per test afterwards (see splitters)
+        self.batch_size = self._config.getint(uname, 'batch_size', fallback=1)
+        unsplittable = [name for (name, isDocker, path) in self.active_clients if name not in splitters]
+        if self.batch_size > 1 and unsplittable:
+            logger.warning("Traces of %s cannot be split per test, falling back to batch_size = 1" % unsplittable)
+            self.batch_size = 1
+        # The directory through which the tests and traces are exchanged with the clients (and where
+        # they are reused, see FilePool). Only failing tests are moved to the artefacts. `shm` = a
+        # RAM-backed directory in /dev/shm, which is created for this run and removed on exit
+        exchange = self._config.get(uname, 'exchange_path', fallback="").strip()
+        self.exchange_path = self.temp_path
+        if exchange == "shm":
+            if os.path.isdir("/dev/shm"):
+                self.exchange_path = "/dev/shm/evmlab-%s" % self.host_id
+                atexit.register(shutil.rmtree, self.exchange_path, ignore_errors=True)
+            else:
+                logger.warning("/dev/shm not available, exchanging the tests through %s" % self.temp_path)
+        elif exchange:
+            self.exchange_path = resolve(exchange)
+
         # expose default section
         self.default = self._config[uname]
 
@@ -133,11 +234,32 @@ class Config(object):
 
     @property
     def testfilesPath(self):
-        return "%s/testfiles/" % self.temp_path
+        return "%s/testfiles/" % self.exchange_path
 
     @property
     def logfilesPath(self):
-        return "%s/logs/" % self.temp_path
+        return "%s/logs/" % self.exchange_path
+
+    def replicaTestfilesPath(self, replica):
+        if replica == 0:
+            return self.testfilesPath
+        return "%s/replica-%d/testfiles/" % (self.exchange_path, replica)
+
+    def replicaLogfilesPath(self, replica):
+        if replica == 0:
+            return self.logfilesPath
+        return "%s/replica-%d/logs/" % (self.exchange_path, replica)
+
+    def containerName(self, client_name, replica):
+        """ The name of the container of a replica of a client. The first one is named after the client """
+        if replica == 0:
+            return client_name
+        return "%s-%d" % (client_name, replica)
+
+    @property
+    def traceSettings(self):
+        return TraceSettings(self.compare_history, self.compare_tail, self.digest_checkpoint,
+                             self.compare_backend, self.trace_fidelity)
 
     @property
     def clientNames(self):
@@ -154,22 +276,213 @@ class Config(object):
         out.append("Fork config:   %s" % self.fork_config)
         out.append("Artefacts:     %s" % self.artefacts)
         out.append("Tempfiles:     %s" % self.temp_path)
+        out.append("Exchange:      %s" % self.exchange_path)
         out.append("Log path:      %s" % self.logfilesPath)
         out.append("Test files:    %s" % self.testfilesPath)
         return out
 
 
+# The settings for processing traces, see Config
+TraceSettings = collections.namedtuple("TraceSettings", ["history", "tail", "digest_checkpoint", "backend", "fidelity"])
+# equivalent, the trace output of the comparison (None if not compared step by step), the
+# Stats.result() per client, and the time it took to process the traces
+TraceResult = collections.namedtuple("TraceResult", ["equivalent", "trace_output", "stats", "pTime"])
+
+canonicalizers = {
+    "geth": VMUtils.GethVM.canonicalized,
+    "cpp": VMUtils.CppVM.canonicalized,
+    "py": VMUtils.PyVM.canonicalized,
+    "parity": VMUtils.ParityVM.canonicalized,
+    "hera": VMUtils.HeraVM.canonicalized,
+}
+
+# Split the trace of a statetest file with several tests into the trace of each test
+splitters = {
+    "geth": VMUtils.GethVM.splitTests,
+    "parity": VMUtils.ParityVM.splitTests,
+}
+
+
+def open_traces(trace_locations, handles, stats=None, reader=None, fidelity=VMUtils.DEFAULT_FIDELITY):
+    """ Opens the trace files, and returns a lazy canonical trace per client. The opened files are
+    appended to handles. If a list of stats is given, a Stats is appended for each client.
+    reader(client, filename) opens a trace file, by default as a TraceFile
+    """
+    traces = []
+    for (client_name, filename) in trace_locations:
+        output = []
+        try:
+            if reader is None:
+                output = VMUtils.TraceFile(filename)
+            else:
+                output = reader(client_name, filename)
+            handles.append(output)
+        except FileNotFoundError:
+            # We hit these sometimes, maybe twice every million execs or so
+            logger.warning("The file %s could not be found!" % filename)
+        steps = canonicalizers[client_name](output, fidelity=fidelity)
+        if stats is not None:
+            client_stats = VMUtils.Stats()
+            steps = client_stats.traceStats(steps)
+            stats.append(client_stats)
+        traces.append(steps)
+    return traces
+
+
+def close_traces(handles):
+    for f in handles:
+        f.close()
+    del handles[:]
+
+
+def process_traces(trace_locations, settings, forceSave=False):
+    """ Canonicalizes and compares the traces of a test, given as a list of (client, trace file).
+    Returns a TraceResult.
+
+    If digests are enabled, the traces are folded into digests first, and only compared step by
+    step if the digests differ (or forceSave). Otherwise they are parsed lazily as they are compared.
+
+    This is what the post-processing workers run, so it takes and returns plain (picklable) values
+    """
+    t1 = time.time()
+    names = [client_name for (client_name, f) in trace_locations]
+    handles = []
+    stats = []
+    try:
+        if settings.backend == "numpy":
+            traces = open_traces(trace_locations, handles, fidelity=settings.fidelity)
+            (equivalent, trace_output, stats) = tracearray.compare_traces(traces, names,
+                                                                          history=settings.history,
+                                                                          tail=settings.tail)
+            return TraceResult(equivalent, trace_output, stats, time.time() - t1)
+
+        traces = open_traces(trace_locations, handles, stats=stats, fidelity=settings.fidelity)
+        start = 0
+        if settings.digest_checkpoint > 0 and len(traces) > 0:
+            digests = [VMUtils.TraceDigest(settings.digest_checkpoint).consume(steps) for steps in traces]
+            close_traces(handles)
+            if VMUtils.TraceDigest.equal(digests) and not forceSave:
+                return TraceResult(True, None, [s.result() for s in stats], time.time() - t1)
+            # Re-read the traces, but skip ahead to a little before the last matching checkpoint
+            start = max(0, VMUtils.TraceDigest.commonPrefix(digests) - settings.history)
+            traces = open_traces(trace_locations, handles, fidelity=settings.fidelity)
+
+        (equivalent, trace_output) = VMUtils.compare_traces(traces, names,
+                                                            history=settings.history,
+                                                            tail=settings.tail,
+                                                            start=start)
+    finally:
+        close_traces(handles)
+    return TraceResult(equivalent, trace_output, [s.result() for s in stats], time.time() - t1)
+
+
+def watch_traces(trace_locations, finished, settings):
+    """ Canonicalizes and compares the traces of a test while the clients are still running,
+    following the trace files as they are written. finished maps each client to a threading.Event,
+    which is set once the client has exited. Returns a TraceResult.
+
+    The comparison ends `tail` steps after the first difference, without waiting for the
+    clients to finish
+    """
+    t1 = time.time()
+    names = [client_name for (client_name, f) in trace_locations]
+    handles = []
+    stats = []
+
+    def follow(client_name, filename):
+        return VMUtils.TailFile(filename, finished[client_name])
+
+    try:
+        traces = open_traces(trace_locations, handles, stats=stats, reader=follow, fidelity=settings.fidelity)
+        (equivalent, trace_output) = VMUtils.compare_traces(traces, names,
+                                                            history=settings.history,
+                                                            tail=settings.tail)
+    finally:
+        close_traces(handles)
+    return TraceResult(equivalent, trace_output, [s.result() for s in stats], time.time() - t1)
+
+
+def _init_postprocess_worker():
+    # ctrl+c is handled by the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _statetest_template(config, seed=None):
+    """ Creates the StateTestTemplate, with the code generators enabled in the config. The tests
+    are regenerated from its seed, which is logged, and the fill recorded in their _info
+    """
+    codegens = {}
+    for engine in (statetest.rndval.RndCodeBytes, statetest.rndval.RndCodeInstr, statetest.rndval.RndCodeSmart2):
+        if config.codegen.getboolean("engine.%s.enabled" % engine.__name__, True):  # is engine enabled?
+            codegens[engine] = int(config.codegen.get("engine.%s.weight" % engine.__name__,
+                                                      "50"))  # create engine/weight mapping
+
+    template = statetest.StateTestTemplate(nonce="0x1d",
+                                           codegenerators=codegens,
+                                           fill_prestate_for_args=True,
+                                           fill_prestate_for_tx_to=True,
+                                           _config=config,
+                                           seed=seed)
+    logger.info("Test template seed 0x%016x" % template.seed)
+    template.info.fuzzer = "evmlab tin"
+    # The tests are filled for the fork we are configured for (see StateTest)
+    template.post[config.fork_config] = template.post.pop("Byzantium")
+    template.add_precomipled_prestates()
+    return template
+
+
+def _generate_tests(config, worker, seed, pool, out, generated):
+    """ Generates tests in a process of its own (see Fuzzer.generate_tests), into files of the shared
+    pool. Each (batch of) tests is passed on as ([(counter, filename, statetest)], batch filename)
+    """
+    global fPool
+    _init_postprocess_worker()
+    fPool = pool
+    template = _statetest_template(config, seed)
+    # The counters of the workers are interleaved, so the test ids are unique
+    counter = worker
+    batch = []
+    while True:
+        (test_obj, data) = template.fill(serialize=True, name=StateTest.testname(config, counter))
+        s = StateTest(test_obj, counter, config=config)
+        s.serialized = data
+        s._filename = fPool.get()
+        counter = counter + config.generator_workers
+        batch.append(s)
+        if len(batch) < config.batch_size:
+            continue
+        batchname = None
+        if len(batch) == 1:
+            s.writeToFile()
+        else:
+            batchname = fPool.get()
+            StateTestBatch(batch, batchname, config).writeToFile()
+        out.put(([(t.number, t.filename, t.statetest) for t in batch], batchname), block=True)
+        with generated.get_lock():
+            generated[worker] = generated[worker] + len(batch)
+        batch = []
+
+
 class RawStateTest(object):
 
     def __init__(self, statetest, identifier, filename, config):
         self.identifier = identifier
         self._filename = filename
         self.statetest = statetest
-        self.canon_traces = []
+        self.traceResult = None
+        self.watcher = None
+        self.watchResult = None
+        self.clientsFinished = {}
+        # The fidelity the test is executed at (set when started)
+        self.fidelity = None
+        # The replica of the clients which executes the test (see Fuzzer.schedule)
+        self.replica = 0
         self.procs = []
         self.traceFiles = []
         self.additionalArtefacts = []
         self._config = config
+        # The json encoded test, if it was encoded when generated
+        self.serialized = None
 
     @property
     def filename(self):
@@ -179,15 +492,22 @@ class RawStateTest(object):
     def id(self):
         return self.identifier
 
+    @property
+    def name(self):
+        """ The top level name of the (first) test in the file """
+        return next(iter(self.statetest))
+
     @property
     def fullfilename(self):
-        return os.path.abspath("%s/%s" % (self._config.testfilesPath, self.filename))
+        return os.path.abspath("%s/%s" % (self._config.replicaTestfilesPath(self.replica), self.filename))
 
     def writeToFile(self):
         # write to unique tmpfile
         logger.debug("Writing file %s" % self.fullfilename)
-        with open(self.fullfilename, 'w') as outfile:
-            json.dump(self.statetest, outfile)
+        # Encoded in one go, and written with a single write
+        data = self.serialized or json.dumps(self.statetest).encode()
+        with open(self.fullfilename, 'wb') as outfile:
+            outfile.write(data)
 
     def removeFiles(self):
 #        f = self.fullfilename
@@ -199,12 +519,25 @@ class RawStateTest(object):
  #       for f in self.traceFiles:
  #           os.remove(f)
 
+    def traceLocations(self):
+        """ Returns a list of (client, trace file) of the stored traces """
+        return [(client_name, f) for ((proc_info, client_name), f) in zip(self.procs, self.traceFiles)]
+
     def tempTraceFilename(self, client):
         return "%s-%s.trace.log" %(self.filename, client)
 #        return "%s-%s.trace.log" % (self.identifier, client)
 
     def tempTraceLocation(self, client):
-        return os.path.abspath("%s/%s" % (self._config.logfilesPath,self.tempTraceFilename(client)))
+        return os.path.abspath("%s/%s" % (self._config.replicaLogfilesPath(self.replica), self.tempTraceFilename(client)))
+
+    def moveToReplica(self, replica):
+        """ Moves the test file to the testfiles of the given replica """
+        if replica == self.replica:
+            return
+        current = self.fullfilename
+        self.replica = replica
+        if os.path.exists(current):
+            os.replace(current, self.fullfilename)
 
     def storeTrace(self, client, command):
         filename = self.tempTraceLocation(client)
@@ -218,7 +551,10 @@ class RawStateTest(object):
         self.traceFiles.append(filename)
 
     def saveArtefacts(self):
-        # Save the actual test json
+        # Save the actual test json. Tests which were executed as part of a batch have no file of their own
+        if not os.path.exists(self.fullfilename):
+            self.writeToFile()
+        # Moved (i.e. copied, if the exchange path is a tmpfs) from the exchange path to the artefacts
         saveloc = "%s/%s" % (self._config.artefacts, self.filename)
         logger.info("Saving testcase as %s", saveloc)
         shutil.move(self.fullfilename, saveloc)
@@ -256,26 +592,105 @@ class StateTest(RawStateTest):
     """
 
     def __init__(self, statetest, counter, config, overwriteFork=True):
-        self.number = None
-        identifier = "%s-%d" %(config.host_id, counter)
+        self.number = counter
+        identifier = StateTest.identify(config, counter)
         filename = "%s-test.json" % identifier
         super().__init__(statetest, identifier, filename, config=config)
 
+        # A test generated in another process (see _generate_tests) has been renamed already
+        if 'randomStatetest' in statetest:
+            if overwriteFork and "Byzantium" in statetest['randomStatetest']['post'].keys():
+                # Replace the fork with what we are currently configured for
+                postState = statetest['randomStatetest']['post'].pop('Byzantium')
+                statetest['randomStatetest']['post'][self._config.fork_config] = postState
 
-        if overwriteFork and "Byzantium" in statetest['randomStatetest']['post'].keys():
-            # Replace the fork with what we are currently configured for
-            postState = statetest['randomStatetest']['post'].pop('Byzantium')
-            statetest['randomStatetest']['post'][self._config.fork_config] = postState
+            # Replace the top level name 'randomStatetest' with something meaningful (same as filename)
+            statetest[StateTest.testname(config, counter)] = statetest.pop('randomStatetest', None)
 
+    @staticmethod
+    def identify(config, counter):
+        """ The identifier (and the stem of the filename) of the test number counter """
+        return "%s-%d" % (config.host_id, counter)
 
-            # Replace the top level name 'randomStatetest' with something meaningful (same as filename)
-        statetest['randomStatetest%s' % self.identifier] = statetest.pop('randomStatetest', None)
+    @staticmethod
+    def testname(config, counter):
+        """ The top level name of the test, which a filled 'randomStatetest' is renamed to """
+        return "randomStatetest%s" % StateTest.identify(config, counter)
 
-        self.statetest = statetest
-        self.canon_traces = []
-        self.procs = []
-        self.traceFiles = []
-        self.additionalArtefacts = []
+
+class StateTestBatch(RawStateTest):
+    """ A number of StateTests, which are written into one statetest file and executed together.
+    Once executed, the traces are split into the traces of each test (see Fuzzer.unbatch),
+    which are then processed as usual
+    """
+
+    def __init__(self, tests, filename, config):
+        statetest = {}
+        for test in tests:
+            statetest.update(test.statetest)
+        identifier = "batch-%s" % tests[0].id
+        super().__init__(statetest, identifier, filename, config)
+        self.tests = tests
+        # The encoded tests are joined into the encoded batch
+        if all(t.serialized for t in tests):
+            self.serialized = b"{" + b", ".join(t.serialized[1:-1] for t in tests) + b"}"
+
+
+class ConcurrencyController(object):
+    """ Controls the number of tests in flight: additive increase, multiplicative decrease.
+
+    The limit is raised by one after every `limit` tests which complete without congestion. On
+    congestion, it's halved (at most once per test latency). Congestion is either
+    - the latency of the tests rising above `tolerance` times the lowest latency seen,
+    - a load average of the host above its number of cpus, or
+    - more than `max_queue_depth` tests queueing at a client worker
+    """
+
+    def __init__(self, initial, maximum, minimum=1, tolerance=2.0, max_queue_depth=2):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.max_queue_depth = max_queue_depth
+        self.cpus = os.cpu_count() or 1
+        # Moving average of the latency, and the baseline it's compared to
+        self.latency = None
+        self.baseline = None
+        self._completed = 0
+        self._lastDecrease = 0
+
+    def congestion(self, queueDepth):
+        """ Returns the reason of congestion, or None """
+        if self.latency > self.tolerance * self.baseline:
+            return "latency %.3fs" % self.latency
+        load = os.getloadavg()[0]
+        if load > self.cpus:
+            return "load %.1f" % load
+        if queueDepth > self.max_queue_depth:
+            return "queue depth %d" % queueDepth
+        return None
+
+    def onCompleted(self, latency, queueDepth=0):
+        """ Adjusts the limit after a test completed in `latency` seconds """
+        if self.latency is None:
+            self.latency = latency
+            self.baseline = latency
+        self.latency = 0.8 * self.latency + 0.2 * latency
+        # The baseline creeps up, so that it follows tests which simply take longer
+        self.baseline = min(self.latency, self.baseline * 1.01)
+        reason = self.congestion(queueDepth)
+        if reason is None:
+            self._completed = self._completed + 1
+            if self._completed >= self.limit:
+                self._completed = 0
+                self.limit = min(self.maximum, self.limit + 1)
+            return
+        self._completed = 0
+        now = time.time()
+        if now - self._lastDecrease > self.latency and self.limit > self.minimum:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._lastDecrease = now
+            logger.info("Congestion (%s), lowering concurrency to %d" % (reason, self.limit))
 
 
 class TestExecutor(object):
@@ -289,7 +704,19 @@ class TestExecutor(object):
             "total_count": 0,
             "num_active_tests": 0,
             "num_active_sockets": 0,
+            "num_pending_tests": 0,
+            "num_reruns": 0,
         }
+        # Tests which failed screening, to be executed again with full traces
+        self.reruns = collections.deque()
+        config = fuzzer._config
+        # This is the max cap of paralellism, it's just to prevent
+        # things going out of hand if tests start piling up
+        maximum = config.max_parallel * config.client_replicas
+        if config.adaptive_concurrency:
+            self.controller = ConcurrencyController(initial=min(os.cpu_count() or 1, maximum), maximum=maximum)
+        else:
+            self.controller = ConcurrencyController(initial=maximum, maximum=maximum, minimum=maximum)
         self.failures = []
         self.traceLengths = collections.deque([], 100)
         self.traceDepths = collections.deque([], 100)
@@ -316,19 +743,32 @@ class TestExecutor(object):
     def testsPerSecond(self):
         return self.numTotals() / (time.time() - self.stats["start_time"])
 
-    def postprocess_test(self, test, reporting=False):
-        # End previous procs
+    def postprocess_test(self, test, reporting=False, result=None):
+        """ Processes the traces of a finished test. If the traces were processed by the
+        post-processing pool, the result is given, and the processes have already been ended
+        """
         if test is None:
             return
-        data = self._fuzzer.end_processes(test)
-        if data is not None:
-            (traceLength, stats) = data
-            self.traceLengths.append(traceLength)
-            self.traceDepths.append(stats['maxDepth'])
-            self.traceConstantinopleOps.append(stats['constatinopleOps'])
+        forceSave = self._fuzzer._config.force_save
+        if result is None:
+            # End previous procs
+            self._fuzzer.end_processes(test)
+            result = process_traces(test.traceLocations(), self._fuzzer.traceSettings(test), forceSave=forceSave)
+
+        if self._fuzzer.needsRerun(test, result, forceSave=forceSave):
+            # Failed screening, run it again with full traces before deciding
+            self._fuzzer.prepareRerun(test)
+            self.reruns.append(test)
+            self.stats["num_reruns"] = self.stats["num_reruns"] + 1
+            return
 
         # Process previous traces
-        failingTestcase = self._fuzzer.processTraces(test, forceSave=self._fuzzer._config.force_save)
+        failingTestcase = self._fuzzer.processTraces(test, forceSave=forceSave, result=result)
+
+        (traceLength, stats) = self._fuzzer.traceSummary(test)
+        self.traceLengths.append(traceLength)
+        self.traceDepths.append(stats['maxDepth'])
+        self.traceConstantinopleOps.append(stats['constatinopleOps'])
         if failingTestcase is None:
             self.onPass()
         else:
@@ -341,14 +781,19 @@ class TestExecutor(object):
                 self._fuzzer._total_trace_len / self._fuzzer._num_traces_processed, self._fuzzer._max_trace_len, self._fuzzer._num_zero_traces/self._fuzzer._num_traces_processed
             ))
 
-    def startFuzzing(self):
+    def nextTests(self):
+        """ Yields the tests to execute: tests to be re-run go first, then newly generated ones """
+        for test in self._fuzzer.generate_tests():
+            while len(self.reruns) > 0:
+                yield self.reruns.popleft()
+            yield test
+
+    def startFuzzing(self, duration=None):
+        """ Executes tests until stopped, or for `duration` seconds """
         print_stats_every_x_seconds = 90
         self.stats["start_time"] = time.time()
         next_stats_print = self.stats["start_time"] + print_stats_every_x_seconds
-        # This is the max cap of paralellism, it's just to prevent
-        # things going out of hand if tests start piling up
-        # We don't expect to actually reach it
-        MAX_PARALELL = 50
+        config = self._fuzzer._config
         # The poller which we use, to register our
         # processes IO channels on
         poller = select.poll()
@@ -357,42 +802,91 @@ class TestExecutor(object):
         # The poll-mask. We listen to everything, except 'ready to write'
         mask = select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP | select.POLLNVAL
 
-        for test in self._fuzzer.generate_tests():
-            test.socketEvent = ""
-            test.socketData = b''
-            if self.stats["num_active_tests"] < MAX_PARALELL:
-                #test.writeToFile()
-                # Start new procs
-                self._fuzzer.start_processes(test)
-                self.stats["num_active_tests"] = self.stats["num_active_tests"] + 1
-                self.stats["num_active_sockets"] = len(active_sockets.keys())
-                # Put the new test to the first position
-                test.numprocs = 0
-                # Register the test IO channel with the poller
-                for (proc_info, client_name) in test.procs:
-                    socket = proc_info["output"]
-
-                    poller.register(socket, mask)
-                    # Make a lookup, socket fd-> (test and socket)
-                    # The poller returns only the fd, a number, we need to 
-                    # remember the actual socket and the test
-                    active_sockets[socket.fileno()] = (test , socket)
-                    # Stash the number of processes somewhere
-                    test.numprocs = test.numprocs + 1
-            else:
-                logger.info("Max paralellism hit -- will sleep for a bit")
-                time.sleep(10)
-            # Check if anyting happened
-            socketlist = poller.poll()
+        # The traces of finished tests are either compared while the tests run (see watch_test),
+        # processed right here, or handed to a pool
+        # of processes, so that parsing long traces does not hold up starting new tests.
+        # The workers are spawned rather than forked, since tests are generated in a thread
+        pool = None
+        pending = {}
+        if config.postprocess_workers > 0:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=config.postprocess_workers,
+                                                          mp_context=multiprocessing.get_context("spawn"),
+                                                          initializer=_init_postprocess_worker)
+            logger.info("Processing traces in %d worker processes" % config.postprocess_workers)
+
+        # The workers of the clients, if any, by fd, and the tests they are executing,
+        # by trace file -> (test, client, worker)
+        workers = {}
+        waiting = {}
+        for worker in self._fuzzer.workers:
+            poller.register(worker.fileno(), mask)
+            workers[worker.fileno()] = worker
+
+        def procFinished(test, client_name):
+            if client_name in test.clientsFinished:
+                test.clientsFinished[client_name].set()
+            test.numprocs = test.numprocs - 1
+            if test.numprocs > 0:
+                return
+            logger.info("All procs finished for test %s" % test.id)
+            self.stats["num_active_tests"] = self.stats["num_active_tests"] - 1
+            # Tests queue up at a worker while it's executing another one
+            queueDepth = max([w.pending - 1 for w in self._fuzzer.workers] + [0])
+            self.controller.onCompleted(time.time() - test.startTime, queueDepth)
+            if test.watcher is not None:
+                self._fuzzer.end_processes(test)
+                test.watcher.join()
+                result = test.watchResult
+                if result is None or len(test.socketData) > 0:
+                    # The watcher failed, or the test is to be ignored
+                    result = process_traces(test.traceLocations(), self._fuzzer.traceSettings(test),
+                                            forceSave=config.force_save)
+                self.postprocess_test(test, reporting=config.enable_reporting, result=result)
+                return
+            self._fuzzer.end_processes(test)
+            for t in self._fuzzer.unbatch(test):
+                if pool is None:
+                    result = process_traces(t.traceLocations(), self._fuzzer.traceSettings(t),
+                                            forceSave=config.force_save)
+                    self.postprocess_test(t, reporting=config.enable_reporting, result=result)
+                else:
+                    future = pool.submit(process_traces, t.traceLocations(), self._fuzzer.traceSettings(t),
+                                         forceSave=config.force_save)
+                    pending[future] = t
+
+        def handleEvents(timeout):
+            """ Polls for finished processes (and post-processing results) for up to timeout ms """
+            socketlist = poller.poll(timeout)
+            for future in [f for f in pending if f.done()]:
+                self.postprocess_test(pending.pop(future), reporting=config.enable_reporting,
+                                      result=future.result())
+            self.stats["num_pending_tests"] = len(pending)
             if len(socketlist) == 0:
-                continue
+                return
             for (socketfd, event) in socketlist:
+                if socketfd in workers:
+                    worker = workers[socketfd]
+                    traces = worker.finished()
+                    if traces is None:
+                        # The worker died. Its tests won't be reported, so finish them as they
+                        # are, and start a new worker
+                        logger.error("Worker for %s exited [%s]" % (worker.container, event_str(event)))
+                        poller.unregister(socketfd)
+                        del workers[socketfd]
+                        traces = [t for (t, (test, c, w)) in waiting.items() if w is worker]
+                        worker = self._fuzzer.start_worker(worker.container, replaces=worker)
+                        poller.register(worker.fileno(), mask)
+                        workers[worker.fileno()] = worker
+                    for trace in traces:
+                        (test, client_name, w) = waiting.pop(trace)
+                        procFinished(test, client_name)
+                    continue
                 # At least one process for this test is finished
 
                 # Stop listeninng to this socket
                 poller.unregister(socketfd)
                 # Find the test
-                (test, socket) = active_sockets.pop(socketfd)
+                (test, socket, client_name) = active_sockets.pop(socketfd)
                 # read it, close it
                 if event & (select.POLLIN| select.POLLPRI):
                     # We don't expect any data here, but we'll take a peek and stash
@@ -402,12 +896,46 @@ class TestExecutor(object):
                 #Also, we'll save the event, may assist with debugging later
                 test.socketEvent = test.socketEvent + ("[%d]" % event)
                 socket.close()
-                test.numprocs = test.numprocs - 1
-                if test.numprocs == 0:
-                    logger.info("All procs finished for test %s" % test.id)
-                    self.stats["num_active_tests"] = self.stats["num_active_tests"] - 1
-                    self.postprocess_test(test, reporting=self._fuzzer._config.enable_reporting)
+                procFinished(test, client_name)
+
 
+        for test in self.nextTests():
+            if duration is not None and time.time() > self.stats["start_time"] + duration:
+                break
+            test.socketEvent = ""
+            test.socketData = b''
+            # Block on the poller until there's room for another test. Tests waiting for
+            # post-processing still hold their files. While traces are being processed, don't
+            # block on the poller indefinitely, but come back to collect the results
+            while self.stats["num_active_tests"] + len(pending) >= self.controller.limit:
+                handleEvents(100 if pending else None)
+            #test.writeToFile()
+            # Start new procs
+            test.startTime = time.time()
+            self._fuzzer.start_processes(test)
+            # The traces of a batch can only be compared once they are split per test
+            if config.compare_while_running and not isinstance(test, StateTestBatch):
+                self._fuzzer.watch_test(test)
+            self.stats["num_active_tests"] = self.stats["num_active_tests"] + 1
+            self.stats["num_active_sockets"] = len(active_sockets.keys())
+            # Put the new test to the first position
+            test.numprocs = 0
+            # Register the test IO channel with the poller
+            for (proc_info, client_name) in test.procs:
+                test.numprocs = test.numprocs + 1
+                if "worker" in proc_info:
+                    # The worker reports when the test is done, on its own channel
+                    waiting[proc_info["trace"]] = (test, client_name, proc_info["worker"])
+                    continue
+                socket = proc_info["output"]
+
+                poller.register(socket, mask)
+                # Make a lookup, socket fd-> (test and socket)
+                # The poller returns only the fd, a number, we need to 
+                # remember the actual socket and the test
+                active_sockets[socket.fileno()] = (test , socket, client_name)
+            # Keep starting tests while there's room, but handle whatever finished meanwhile
+            handleEvents(0)
             if time.time()> next_stats_print:
                 logger.info("=" * 25)
                 logger.info("current status: %r"%self.status())
@@ -447,17 +975,268 @@ class TestExecutor(object):
             "numConst": statistics.mean(self.traceConstantinopleOps) if self.traceConstantinopleOps else "NA",
             "activeSockets": self.stats["num_active_sockets"],
             "activeTests": self.stats["num_active_tests"],
+            "pendingTests": self.stats["num_pending_tests"],
+            "reruns": self.stats["num_reruns"],
+            "concurrency": self.controller.limit,
         }
 
 
+class AsyncTestExecutor(TestExecutor):
+    """ Executes the tests like TestExecutor, but on an asyncio event loop. Test generation, the
+    execution of the tests and the processing of the traces are stages, which run as tasks
+    connected by bounded queues. The clients are executed through the ClientWorkers if there are
+    any (whose output is read by the loop), otherwise with a `docker exec` subprocess per test and client
+    """
+
+    # The number of generated tests waiting to be executed
+    QUEUE_SIZE = 20
+
+    def startFuzzing(self, duration=None):
+        """ Executes tests until stopped, or for `duration` seconds """
+        asyncio.run(self.fuzz(duration))
+
+    async def fuzz(self, duration=None):
+        config = self._fuzzer._config
+        loop = asyncio.get_running_loop()
+        self.stats["start_time"] = time.time()
+        next_stats_print = self.stats["start_time"] + 90
+        # trace file -> (future, worker) of the tests sent to the workers
+        self._waiting = {}
+        for worker in self._fuzzer.workers:
+            loop.add_reader(worker.fileno(), self._onWorkerOutput, worker)
+
+        pool = None
+        if config.postprocess_workers > 0:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=config.postprocess_workers,
+                                                          mp_context=multiprocessing.get_context("spawn"),
+                                                          initializer=_init_postprocess_worker)
+        generated = asyncio.Queue(maxsize=AsyncTestExecutor.QUEUE_SIZE)
+        executed = asyncio.Queue(maxsize=config.max_parallel * config.client_replicas)
+        # Notified whenever a test is done, and there may be room for another one
+        done = asyncio.Condition()
+        stages = [asyncio.create_task(self._generate(generated))]
+        stages.extend(asyncio.create_task(self._process(executed, done, pool))
+                      for i in range(max(1, config.postprocess_workers)))
+        running = set()
+        try:
+            while duration is None or time.time() < self.stats["start_time"] + duration:
+                test = await generated.get()
+                if test is None:
+                    # Out of tests, finish the ones in flight
+                    if running:
+                        await asyncio.wait(running)
+                    await executed.join()
+                    break
+                async with done:
+                    await done.wait_for(lambda: self.stats["num_active_tests"] + self.stats["num_pending_tests"] < self.controller.limit)
+                # Counted before the task runs, since none of the awaits above need to yield
+                self.stats["num_active_tests"] = self.stats["num_active_tests"] + 1
+                task = asyncio.create_task(self._execute(test, executed))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                if time.time() > next_stats_print:
+                    logger.info("current status: %r" % self.status())
+                    next_stats_print = time.time() + 90
+        finally:
+            for task in stages + list(running):
+                task.cancel()
+            for worker in self._fuzzer.workers:
+                loop.remove_reader(worker.fileno())
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+    async def _generate(self, generated):
+        loop = asyncio.get_running_loop()
+        tests = self.nextTests()
+        while True:
+            # The tests are generated in a thread (see Fuzzer.generate_tests). None marks the end
+            test = await loop.run_in_executor(None, next, tests, None)
+            await generated.put(test)
+            if test is None:
+                return
+
+    async def _execute(self, test, executed):
+        """ Executes the test, which is counted as active already (see fuzz) """
+        config = self._fuzzer._config
+        test.socketEvent = ""
+        test.socketData = b''
+        test.startTime = time.time()
+        self._fuzzer.prepare(test)
+        commands = self._fuzzer.commands(test)
+        test.procs = [({'cmd': " ".join(cmd)}, client_name) for (client_name, container, cmd, trace) in commands]
+        # The traces of a batch can only be compared once they are split per test
+        if config.compare_while_running and not isinstance(test, StateTestBatch):
+            self._fuzzer.watch_test(test)
+        logger.info("Starting processes for %s on test %s" % (config.clientNames, test.id))
+        await asyncio.gather(*[self._executeClient(test, *command) for command in commands])
+        logger.info("All procs finished for test %s" % test.id)
+        queueDepth = max([w.pending - 1 for w in self._fuzzer.workers] + [0])
+        self.controller.onCompleted(time.time() - test.startTime, queueDepth)
+        self.stats["num_active_tests"] = self.stats["num_active_tests"] - 1
+        self.stats["num_pending_tests"] = self.stats["num_pending_tests"] + 1
+        await executed.put(test)
+
+    async def _executeClient(self, test, client_name, container, cmd, trace):
+        workers = [w for w in self._fuzzer.workers if w.container == container]
+        if len(workers) > 0:
+            proc_info = self._fuzzer.execTest(container, cmd, trace)
+            future = asyncio.get_running_loop().create_future()
+            self._waiting[trace] = (future, proc_info["worker"])
+            await future
+        elif client_name in self._fuzzer._config.binaries:
+            with open(test.tempTraceLocation(client_name), "wb") as f:
+                proc = await asyncio.create_subprocess_exec(*cmd, stdout=f, stderr=asyncio.subprocess.STDOUT)
+            await proc.wait()
+        else:
+            proc = await asyncio.create_subprocess_exec("docker", "exec", container, *Fuzzer.shWrap(cmd, trace),
+                                                        stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.STDOUT)
+            (output, x) = await proc.communicate()
+            test.socketData = test.socketData + output
+            test.socketEvent = test.socketEvent + ("[%d]" % proc.returncode)
+        if client_name in test.clientsFinished:
+            test.clientsFinished[client_name].set()
+
+    def _onWorkerOutput(self, worker):
+        traces = worker.finished()
+        if traces is None:
+            # The worker died. Its tests won't be reported, so finish them as they are,
+            # and start a new worker
+            logger.error("Worker for %s exited" % worker.container)
+            loop = asyncio.get_running_loop()
+            loop.remove_reader(worker.fileno())
+            traces = [t for (t, (future, w)) in self._waiting.items() if w is worker]
+            worker = self._fuzzer.start_worker(worker.container, replaces=worker)
+            loop.add_reader(worker.fileno(), self._onWorkerOutput, worker)
+        for trace in traces:
+            (future, w) = self._waiting.pop(trace)
+            future.set_result(None)
+
+    async def _process(self, executed, done, pool):
+        config = self._fuzzer._config
+        loop = asyncio.get_running_loop()
+        while True:
+            test = await executed.get()
+            self._fuzzer.end_processes(test)
+            result = None
+            if test.watcher is not None:
+                await loop.run_in_executor(None, test.watcher.join)
+                result = test.watchResult
+                if len(test.socketData) > 0:
+                    # The test is to be ignored
+                    result = None
+            # Splitting the traces of a batch reads and writes them, so it's done in a thread as well
+            for t in await loop.run_in_executor(None, self._fuzzer.unbatch, test):
+                if result is None:
+                    # Processed in a thread, unless there are post-processing workers
+                    result = await loop.run_in_executor(pool, functools.partial(
+                        process_traces, t.traceLocations(), self._fuzzer.traceSettings(t), forceSave=config.force_save))
+                self.postprocess_test(t, reporting=config.enable_reporting, result=result)
+                result = None
+            self.stats["num_pending_tests"] = self.stats["num_pending_tests"] - 1
+            executed.task_done()
+            async with done:
+                done.notify_all()
+
+
+class ClientWorker(object):
+    """ A long-lived shell in the container of a client, which executes the tests sent to it.
+
+    Each test is sent as a line `<trace file> <command>` on stdin. The shell runs the command with
+    its output to /logs/<trace file>, and prints the name of the trace file on stdout once it
+    is done. This saves the docker exec round-trip (and the /bin/sh wrapper) per test and client.
+
+    If a (host) logs directory is given, the shell runs locally instead, for a client which is
+    executed locally
+    """
+
+    LOOP = 'while read -r trace cmd; do eval "$cmd" > "%s/$trace" 2>&1; echo "$trace"; done'
+
+    def __init__(self, container, logs=None):
+        self.container = container
+        self.logs = logs
+        # Number of tests sent, which are not done yet
+        self.pending = 0
+        self._buffer = b''
+        if logs is None:
+            cmd = ["docker", "exec", "-i", container, "/bin/sh", "-c", ClientWorker.LOOP % "/logs"]
+        else:
+            cmd = ["/bin/sh", "-c", ClientWorker.LOOP % logs]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    def fileno(self):
+        return self.proc.stdout.fileno()
+
+    def send(self, cmd, tracefile):
+        """ Starts executing cmd, with the output to the given trace file """
+        # The shell evaluates the line, so the arguments are quoted (see Fuzzer.cppCommand)
+        line = "%s %s\n" % (tracefile, " ".join(shlex.quote(a) for a in cmd))
+        try:
+            self.proc.stdin.write(line.encode())
+        except BrokenPipeError:
+            # The worker exited. The poller sees it exit, and finishes its tests
+            logger.warning("Worker for %s exited, could not send %s" % (self.container, tracefile))
+        self.pending = self.pending + 1
+        return {'cmd': " ".join(cmd), 'worker': self, 'trace': tracefile}
+
+    def finished(self):
+        """ Reads the output of the worker, and returns the trace files of the finished tests.
+        Returns None if the worker has exited
+        """
+        data = os.read(self.fileno(), 65536)
+        if len(data) == 0:
+            return None
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        traces = [l.decode() for l in lines if l]
+        self.pending = self.pending - len(traces)
+        return traces
+
+    def stop(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except Exception:
+            self.proc.kill()
+
+
+class LocalProcess(object):
+    """ A client executing a test as a local process, with its output to the trace file.
+    To the poller, it looks like the socket of a docker exec: it hangs up once the process exits
+    """
+
+    def __init__(self, cmd, output):
+        (self._fd, w) = os.pipe()
+        with open(output, "wb") as f:
+            self.proc = subprocess.Popen(cmd, stdout=f, stderr=subprocess.STDOUT, pass_fds=(w,))
+        os.close(w)
+
+    def fileno(self):
+        return self._fd
+
+    def readall(self):
+        # The process writes nothing to the pipe
+        return os.read(self._fd, 65536)
+
+    def close(self):
+        os.close(self._fd)
+        self.proc.wait()
+
+
 class Fuzzer(object):
 
-    canonicalizers = {
-        "geth": VMUtils.GethVM.canonicalized,
-        "cpp": VMUtils.CppVM.canonicalized,
-        "py": VMUtils.PyVM.canonicalized,
-        "parity": VMUtils.ParityVM.canonicalized,
-        "hera": VMUtils.HeraVM.canonicalized,
+    canonicalizers = canonicalizers
+
+    # The tracing flags of geth per fidelity level. geth reports the stateRoot and gasUsed
+    # along with the json trace only, so the trace is kept as small as possible at stateroot-only.
+    # The clients still write a trace of every step then (parity a full one), screening only saves
+    # decoding and comparing the steps
+    gethTraceFlags = {
+        "stateroot-only": ["--json", "--nomemory", "--nostack"],
+        "ops": ["--json", "--nomemory", "--nostack"],
+        "ops+gas": ["--json", "--nomemory", "--nostack"],
+        "full-stack": ["--json", "--nomemory"],
+        "full+memory": ["--json"],
     }
 
     def __init__(self, config=None):
@@ -468,27 +1247,26 @@ class Fuzzer(object):
         self._max_trace_len = 0
         self._num_zero_traces = 0
 
-        self._dockerclient = docker.from_env()
+        self._dockerclient = None
+        if len(config.binaries) < len(config.active_clients):
+            if docker is None:
+                raise ImportError("docker not installed. run `#> pip install evmlab[docker]` to install.")
+            self._dockerclient = docker.from_env()
+        # The ClientWorkers of all clients, if config.client_workers
+        self.workers = []
+        # The number of tests executing on each replica, see schedule
+        self.replicaLoad = [0] * config.client_replicas
+        self._scheduled = 0
 
         if config.docker_force_update_image is not None:
             for image in config.docker_force_update_image:
                 self.docker_remove_image(image=image, force=True)
 
-        codegens = {}
-        for engine in (statetest.rndval.RndCodeBytes, statetest.rndval.RndCodeInstr, statetest.rndval.RndCodeSmart2):
-            if self._config.codegen.getboolean("engine.%s.enabled" % engine.__name__, True):  # is engine enabled?
-                codegens[engine] = int(self._config.codegen.get("engine.%s.weight" % engine.__name__,
-                                                                "50"))  # create engine/weight mapping
+        # The number of tests generated by each generator process, see generate_tests
+        self.generated = []
 
         # todo: instantiate once?
-
-        self.statetest_template = statetest.StateTestTemplate(nonce="0x1d",
-                                                              codegenerators=codegens,
-                                                              fill_prestate_for_args=True,
-                                                              fill_prestate_for_tx_to=True,
-                                                              _config=self._config)
-        self.statetest_template.info.fuzzer = "evmlab tin"
-        self.statetest_template.add_precomipled_prestates()
+        self.statetest_template = _statetest_template(self._config, config.generator_seed)
 
     def docker_remove_image(self, image, force=True):
         self._dockerclient.images.remove(image=image, force=force)
@@ -507,27 +1285,58 @@ class Fuzzer(object):
 
         """
         daemons = []
+        self.replicaLoad = [0] * self._config.client_replicas
         # Start the processes
         for (client_name, isDocker, cmd) in self._config.active_clients:
             if isDocker:
-                logger.info("Starting daemon for %s : %s", client_name, cmd)
-                # First, kill off any existing daemons
-                self.kill_daemon(client_name)
-                procinfo = self.start_daemon(client_name, cmd)
-                daemons.append((procinfo, client_name))
+                for replica in range(self._config.client_replicas):
+                    container = self._config.containerName(client_name, replica)
+                    logger.info("Starting daemon for %s : %s", container, cmd)
+                    # First, kill off any existing daemons
+                    self.kill_daemon(container)
+                    procinfo = self.start_daemon(container, cmd, replica)
+                    daemons.append((procinfo, container))
+                    for i in range(self._config.client_workers):
+                        self.start_worker(container)
             else:
-                logger.warning("Not a docker client %s", client_name)
+                logger.info("Executing %s locally: %s", client_name, cmd)
+                for replica in range(self._config.client_replicas):
+                    logfiles = self._config.replicaLogfilesPath(replica)
+                    os.makedirs(self._config.replicaTestfilesPath(replica), exist_ok=True)
+                    os.makedirs(logfiles, exist_ok=True)
+                    for i in range(self._config.client_workers):
+                        self.start_worker(self._config.containerName(client_name, replica), logs=logfiles)
+
+    def start_worker(self, container, replaces=None, logs=None):
+        """ Starts a ClientWorker in a container (or locally, writing to the given logs directory),
+        optionally in place of a (dead) one, and returns it """
+        logger.info("Starting worker for %s" % container)
+        if replaces is not None:
+            logs = replaces.logs
+        worker = ClientWorker(container, logs=logs)
+        if replaces is not None:
+            replaces.stop()
+            self.workers.remove(replaces)
+        self.workers.append(worker)
+        return worker
 
     def stop_daemons(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
         # Start the processes
         for (client_name, isDocker, cmd) in self._config.active_clients:
             if isDocker:
-                logger.info("Stopping daemon for %s : %s", client_name, cmd)
-                self.kill_daemon(client_name)
-            else:
-                logger.warning("Not a docker client %s", client_name)
-
-    def start_daemon(self, clientname, imagename):
+                for replica in range(self._config.client_replicas):
+                    container = self._config.containerName(client_name, replica)
+                    logger.info("Stopping daemon for %s : %s", container, cmd)
+                    self.kill_daemon(container)
+
+    def start_daemon(self, clientname, imagename, replica=0):
+        testfiles = self._config.replicaTestfilesPath(replica)
+        logfiles = self._config.replicaLogfilesPath(replica)
+        os.makedirs(testfiles, exist_ok=True)
+        os.makedirs(logfiles, exist_ok=True)
         self._dockerclient.containers.run(image=imagename,
                                     entrypoint="sleep",
                                     command=["356d"],
@@ -535,8 +1344,8 @@ class Fuzzer(object):
                                     detach=True,
                                     remove=True,
                                     volumes={
-                                        self._config.testfilesPath: {'bind': '/testfiles/', 'mode': "rw"},
-                                        self._config.logfilesPath: {'bind': '/logs/', 'mode': "rw"},
+                                        testfiles: {'bind': '/testfiles/', 'mode': "rw"},
+                                        logfiles: {'bind': '/logs/', 'mode': "rw"},
                                     })
 
         logger.info("Started docker daemon %s %s" % (imagename, clientname))
@@ -559,15 +1368,21 @@ class Fuzzer(object):
 
         returns (filename, object)
         """
+        if self._config.generator_workers > 0:
+            yield from self.generate_tests_in_processes()
+            return
 
         # We'll offload test generation to another thread
         q = queue.Queue(maxsize = 20)
         def createATest():
             counter = 0
+            batch = []
             while True:
                 # prestates are reused and regenerated according to the settings in prestate.txto.*, prestate.other.*
-                test_obj = self.statetest_template.fill()
+                (test_obj, data) = self.statetest_template.fill(serialize=True,
+                                                                name=StateTest.testname(self._config, counter))
                 s = StateTest(test_obj, counter, config=self._config)
+                s.serialized = data
                 ## testing
                 # print(test_obj.keys())
                 # tname = list(test_obj.keys())[0]
@@ -577,16 +1392,67 @@ class Fuzzer(object):
                 # end
 
                 s._filename = fPool.get()
-                s.writeToFile()
                 counter = counter + 1
+                if self._config.batch_size > 1:
+                    batch.append(s)
+                    if len(batch) < self._config.batch_size:
+                        continue
+                    s = StateTestBatch(batch, fPool.get(), self._config)
+                    batch = []
+                s.writeToFile()
                 q.put(s, block=True)
 
-        t = threading.Thread(target=createATest)
+        t = threading.Thread(target=createATest, daemon=True)
         t.start()
         # And here, just pop off the queue and yield
         while True:
             yield q.get()
 
+    def generate_tests_in_processes(self):
+        """ Same as generate_tests, but the tests are generated by config.generator_workers processes,
+        into the files of a pool shared with them. The generators block while 20 tests are queued
+        """
+        global fPool
+        config = self._config
+        ctx = multiprocessing.get_context("spawn")
+        fPool = SharedFilePool(ctx, fPool.counter)
+        q = ctx.Queue(maxsize=20)
+        self.generated = ctx.Array('l', config.generator_workers)
+        seed = config.generator_seed
+        if seed is None:
+            seed = random.getrandbits(64)
+        logger.info("Starting %d test generators, seed %d" % (config.generator_workers, seed))
+        master = random.Random(seed)
+        for worker in range(config.generator_workers):
+            ctx.Process(target=_generate_tests, args=(config, worker, master.getrandbits(64), fPool, q, self.generated),
+                        daemon=True).start()
+        while True:
+            (generated, batchname) = q.get()
+            tests = []
+            for (counter, filename, test_obj) in generated:
+                s = StateTest(test_obj, counter, config=config)
+                s._filename = filename
+                tests.append(s)
+            if batchname is None:
+                yield tests[0]
+            else:
+                yield StateTestBatch(tests, batchname, config)
+
+    def benchmark_generators(self, duration):
+        """ Runs the test generator processes for duration seconds, and returns the tests/s of each """
+        tests = self.generate_tests()
+        # Don't count the startup of the processes
+        next(tests).removeFiles()
+        start = time.time()
+        counts = list(self.generated)
+        while time.time() < start + duration:
+            test = next(tests)
+            for t in getattr(test, "tests", []):
+                t.removeFiles()
+            test.removeFiles()
+        elapsed = time.time() - start
+        return [(n - n0) / elapsed for (n, n0) in zip(self.generated, counts)]
+
     def benchmark(self, method=None, duration=None):
         counter = 0
 
@@ -618,13 +1484,30 @@ class Fuzzer(object):
 
         return sum(tdiffs)/len(tdiffs)
 
-    def processTraces(self, test, forceSave=False):
+    def processTraces(self, test, forceSave=False, result=None):
+        """ Processes the traces of the test, unless the result of processing them is given.
+        Returns the test if it failed (or forceSave), otherwise None
+        """
         if test is None:
             return None
 
         # Process previous traces
+        if result is None:
+            result = process_traces(test.traceLocations(), self.traceSettings(test), forceSave=forceSave)
+        test.traceResult = result
+        (equivalent, trace_output) = (result.equivalent, result.trace_output)
 
-        (equivalent, trace_output) = VMUtils.compare_traces(test.canon_traces, self._config.clientNames)
+        for (stats, (client_name, f)) in zip(result.stats, test.traceLocations()):
+            tracelen = stats["steps"]
+            self._num_traces_processed += 1
+            self._total_trace_len += tracelen
+            self._max_trace_len = max(self._max_trace_len, tracelen)
+            if tracelen==0:
+                self._num_zero_traces += 1
+            logger.info("Processed %s steps for %s on test %s (depth: %s, ConstantinopleOps: %s)"
+                        % (tracelen, client_name, test.identifier,
+                        stats.get("maxDepth","nA"), stats.get("constatinopleOps","nA")))
+        logger.info("Compared traces for test %s, pTime:%.02f ms" % (test.identifier, 1000 * result.pTime))
 
         if equivalent and not forceSave:
             test.removeFiles()
@@ -648,9 +1531,14 @@ class Fuzzer(object):
         from collections import deque
         buf = deque([], n)
         index = 0
+        # The comparison may have dropped equivalent steps in front of the diff
+        omitted = 0
         for index, line in enumerate(combined_trace):
+            if line.startswith("[..]"):
+                omitted = omitted + int(line.split()[1]) - 1
+                continue
             if line.startswith("[!!]"):
-                buf.append("\n---- [ %d steps in total before diff ]-------\n\n" % (index))
+                buf.append("\n---- [ %d steps in total before diff ]-------\n\n" % (index + omitted))
                 break
             buf.append(line)
 
@@ -664,6 +1552,88 @@ class Fuzzer(object):
         with open(sys.argv[1]) as f:
             print("".join(self.get_summary(f.readlines())))
 
+    def traceSettings(self, test):
+        """ Returns the TraceSettings for processing the traces of the test """
+        return self._config.traceSettings._replace(fidelity=test.fidelity or self._config.trace_fidelity)
+
+    def unbatch(self, test):
+        """ Returns the tests of an executed (and ended) batch, with the trace of each client split
+        into the traces of the tests. A test which is not a batch is returned as is
+        """
+        if not isinstance(test, StateTestBatch):
+            return [test]
+        tests = {list(t.statetest.keys())[0]: t for t in test.tests}
+        for t in test.tests:
+            t.replica = test.replica
+        for (client_name, filename) in test.traceLocations():
+            try:
+                with VMUtils.TraceFile(filename) as f:
+                    for (name, lines) in splitters[client_name](f):
+                        if name not in tests:
+                            logger.warning("Unexpected test %s in the %s trace of %s" % (name, client_name, test.id))
+                            continue
+                        with open(tests[name].tempTraceLocation(client_name), "wb") as out:
+                            out.writelines(lines)
+            except FileNotFoundError:
+                logger.warning("The file %s could not be found!" % filename)
+        for t in test.tests:
+            t.fidelity = test.fidelity
+            t.socketData = test.socketData
+            t.socketEvent = test.socketEvent
+            t.procs = list(test.procs)
+            if len(test.traceFiles) > 0:
+                for (proc_info, client_name) in t.procs:
+                    t.storeTrace(client_name, proc_info['cmd'])
+        test.removeFiles()
+        return test.tests
+
+    def needsRerun(self, test, result, forceSave=False):
+        """ Whether the test was screened at a lower fidelity, and needs to be executed again
+        with full traces, either to produce the artefacts of a failure, or because everything is saved
+        """
+        if test.fidelity is None or test.fidelity == self._config.trace_fidelity:
+            return False
+        return forceSave or not result.equivalent
+
+    def prepareRerun(self, test):
+        """ Resets the test, so that it's executed again at the configured trace_fidelity """
+        logger.info("Test %s failed screening, re-running it with %s traces" % (test.id, self._config.trace_fidelity))
+        test.fidelity = self._config.trace_fidelity
+        if not os.path.exists(test.fullfilename):
+            # Executed as part of a batch until now
+            test.writeToFile()
+        test.procs = []
+        test.traceFiles = []
+        test.traceResult = None
+        test.watcher = None
+        test.watchResult = None
+        test.clientsFinished = {}
+
+    def schedule(self, test):
+        """ Picks the replica which executes the test, and moves the test there """
+        replicas = range(self._config.client_replicas)
+        if self._config.replica_scheduling == "round-robin":
+            replica = self._scheduled % len(replicas)
+        else:
+            replica = min(replicas, key=lambda i: self.replicaLoad[i])
+        self._scheduled = self._scheduled + 1
+        test.moveToReplica(replica)
+        self.replicaLoad[replica] = self.replicaLoad[replica] + 1
+
+    def prepare(self, test):
+        """ Sets the fidelity the test is executed at, schedules it to a replica, and removes the
+        traces of an earlier test with the same (pooled) filename. Otherwise a watcher could read
+        the trace of the earlier test, before the client truncates it
+        """
+        if test.fidelity is None:
+            test.fidelity = "stateroot-only" if self._config.screening else self._config.trace_fidelity
+        self.schedule(test)
+        for client_name in self._config.clientNames:
+            try:
+                os.remove(test.tempTraceLocation(client_name))
+            except FileNotFoundError:
+                pass
+
     def start_processes(self, test):
 
         starters = {'geth': self.startGeth,
@@ -671,6 +1641,7 @@ class Fuzzer(object):
                     'parity': self.startParity,
                     'hera': self.startHera}
 
+        self.prepare(test)
         logger.info("Starting processes for %s on test %s" % (self._config.clientNames, test.id))
         # Start the processes
         for (client_name, x, y) in self._config.active_clients:
@@ -680,60 +1651,82 @@ class Fuzzer(object):
             else:
                 logger.warning("Undefined client %s", client_name)
 
+    def watch_test(self, test):
+        """ Starts comparing the traces of a started test in a thread, while its clients are running.
+        If the traces differ, the clients which are still running are killed, instead of
+        letting them run to completion
+        """
+        test.clientsFinished = {client_name: threading.Event() for (proc_info, client_name) in test.procs}
+        locations = [(client_name, test.tempTraceLocation(client_name)) for (proc_info, client_name) in test.procs]
+
+        def watch():
+            try:
+                test.watchResult = watch_traces(locations, test.clientsFinished, self.traceSettings(test))
+            except Exception as e:
+                logger.warning("Failed to compare traces of test %s while running: %s" % (test.id, e))
+                return
+            if test.watchResult.equivalent:
+                return
+            for (client_name, finished) in test.clientsFinished.items():
+                if not finished.is_set():
+                    logger.info("Traces of test %s differ, killing %s" % (test.id, client_name))
+                    self.kill_test_process(client_name, test)
+
+        test.watcher = threading.Thread(target=watch, daemon=True)
+        test.watcher.start()
+
+    def kill_test_process(self, client_name, test):
+        """ Kills the process executing the test in the container of the client """
+        for (proc_info, name) in test.procs:
+            if name == client_name and isinstance(proc_info.get('output'), LocalProcess):
+                proc_info['output'].proc.kill()
+                return
+        # Matches the path of the test file in the command of the client, and not the files whose
+        # names start with the same name (pool_3 and pool_30)
+        cmd = ["", "/testfiles/%s" % os.path.basename(test.filename)]
+        try:
+            if client_name in self._config.binaries:
+                # Executed by a local worker
+                cmd = self.localCommand(client_name, test, cmd)
+                subprocess.call(["pkill", "-f", "%s( |$)" % re.escape(cmd[1])])
+                return
+            container = self._dockerclient.containers.get(self._config.containerName(client_name, test.replica))
+            container.exec_run(["pkill", "-f", "%s( |$)" % re.escape(cmd[1])])
+        except Exception as e:
+            logger.warning("Failed to kill %s on test %s: %s" % (client_name, test.id, e))
+
     def end_processes(self, test):
-        """ End processes for the given test, slurp up the output and compare the traces
-        returns the length of the canon-trace emitted (or -1)
+        """ End processes for the given test, and store the trace of each client. The traces
+        are canonicalized and compared by processTraces (or in the post-processing pool)
         """
         # Handle the old processes
         if test is None:
             return None
-        tracelen = 0
-        canon_steps = None
-        canon_trace = []
-        first = True
-        stats = VMUtils.Stats()
-        for (proc_info, client_name) in test.procs:
-            t1 = time.time()
-            if len(test.socketData) > 0:
-                # If there was any output, it indicates an error, see #102. 
-                # The only possible output, since we wrap the execution and pipe everything to file, 
-                # are docker container exec errors if it could not instantiate the executable. 
-                # In that case, which happens about once a million execs, just ignore this test and move on. 
-                logger.warning("Got spurious docker failure: %s", str(test.socketData))
-                return (0, stats.result())
+        self.replicaLoad[test.replica] = self.replicaLoad[test.replica] - 1
+        if len(test.socketData) > 0:
+            # If there was any output, it indicates an error, see #102. 
+            # The only possible output, since we wrap the execution and pipe everything to file, 
+            # are docker container exec errors if it could not instantiate the executable. 
+            # In that case, which happens about once a million execs, just ignore this test and move on. 
+            logger.warning("Got spurious docker failure: %s", str(test.socketData))
+            return
 
+        for (proc_info, client_name) in test.procs:
             test.storeTrace(client_name, proc_info['cmd'])
-            canonicalizer = self.canonicalizers[client_name]
-            canon_steps = []
-            filename = test.tempTraceLocation(client_name)
-            try:
-                with open(filename) as output:
-                    canon_step_generator = canonicalizer(output)
-                    stat_generator = stats.traceStats(canon_step_generator)
-                    canon_trace = [VMUtils.toText(step) for step in stat_generator]
-            except FileNotFoundError:
+            if not os.path.exists(test.tempTraceLocation(client_name)):
                 # We hit these sometimes, maybe twice every million execs or so
-                logger.warning("The file %s could not be found!" % filename)
+                logger.warning("The file %s could not be found!" % test.tempTraceLocation(client_name))
                 logger.warning("Socket event %s" % test.socketEvent)
                 logger.warning("Socket data %s" %  str(test.socketData))
                 #TODO, try to find out what happened -- if there's any output from the process
-            stats.stop()
-            test.canon_traces.append(canon_trace)
-            tracelen = len(canon_trace)
-            self._num_traces_processed += 1
-            self._total_trace_len += tracelen
-            self._max_trace_len = max(self._max_trace_len, tracelen)
-            if tracelen==0:
-                self._num_zero_traces += 1
-            t2 = time.time()
-            logger.info("Processed %s steps for %s on test %s, pTime:%.02f ms (depth: %s, ConstantinopleOps: %s)"
-                        % (tracelen, client_name, test.identifier, 1000 * (t2 - t1),
-                        stats.result().get("maxDepth","nA"), stats.result().get("constatinopleOps","nA")))
 
-        # print(stats)
-        # print(canon_steps)
-        # print("\n".join(canon_trace))
-        return (tracelen, stats.result())
+    def traceSummary(self, test):
+        """ Returns the length of the (compared part of the) canon-trace, and the stats of the first client
+        """
+        if test.traceResult is None or len(test.traceResult.stats) == 0:
+            return (0, VMUtils.Stats().result())
+        stats = test.traceResult.stats
+        return (stats[-1]["steps"], stats[0])
 
     def execInDocker(self, name, cmd, stdout=True, stderr=True):
         start_time = time.time()
@@ -769,10 +1762,38 @@ class Fuzzer(object):
 
         return retval
 
+    def execClient(self, client_name, test, cmd, stdout=True, stderr=True):
+        """ Executes a test with a client, locally if it's configured with a binary, otherwise in
+        its container. cmd is the command for the container
+        """
+        name = self._config.containerName(client_name, test.replica)
+        if client_name not in self._config.binaries:
+            return self.execTest(name, cmd, test.tempTraceFilename(client_name), stdout=stdout, stderr=stderr)
+        cmd = self.localCommand(client_name, test, cmd)
+        if any(w.container == name for w in self.workers):
+            return self.execTest(name, cmd, test.tempTraceFilename(client_name))
+        return {'cmd': " ".join(cmd), 'output': LocalProcess(cmd, test.tempTraceLocation(client_name))}
+
+    def localCommand(self, client_name, test, cmd):
+        """ Maps a command for the container of a client to the local binary and testfiles """
+        testfiles = self._config.replicaTestfilesPath(test.replica)
+        return [self._config.binaries[client_name]] + \
+               [testfiles + a[len("/testfiles/"):] if a.startswith("/testfiles/") else a for a in cmd[1:]]
+
+    def execTest(self, name, cmd, output, stdout=True, stderr=True):
+        """ Executes a test in the named container, with output to the given trace file.
+        The test is sent to the least busy worker of the client if there are any, otherwise
+        it's executed through docker exec
+        """
+        workers = [w for w in self.workers if w.container == name]
+        if len(workers) > 0:
+            return min(workers, key=lambda w: w.pending).send(cmd, output)
+        return self.execInDocker(name, Fuzzer.shWrap(cmd, output), stdout=stdout, stderr=stderr)
+
     @staticmethod
     def shWrap(cmd, output):
         """ Wraps a command in /bin/sh, with output to the given file"""
-        return ["/bin/sh", "-c", " ".join(cmd) + " &> /logs/%s" % output]
+        return ["/bin/sh", "-c", " ".join(shlex.quote(a) for a in cmd) + " &> /logs/%s" % output]
 
     def startGeth(self, test):
         """
@@ -783,36 +1804,64 @@ class Fuzzer(object):
         docker exec -it <name> <command>
 
         """
-        cmd = ["evm", "--json", "--nomemory", "statetest", "/testfiles/%s" % os.path.basename(test.filename)]
-        cmd = Fuzzer.shWrap(cmd, test.tempTraceFilename('geth'))
-        return self.execInDocker("geth", cmd, stdout=False)
+        return self.execClient("geth", test, self.gethCommand(test), stdout=False)
+
+    def gethCommand(self, test):
+        return ["evm"] + Fuzzer.gethTraceFlags[test.fidelity] + \
+               ["statetest", "/testfiles/%s" % os.path.basename(test.filename)]
 
     def startParity(self, test):
-        cmd = ["/parity-evm", "state-test", "--std-json", "/testfiles/%s" % os.path.basename(test.filename)]
+        return self.execClient("parity", test, self.parityCommand(test))
+
+    def parityCommand(self, test):
+        # Parity reports the stateRoot as part of the json trace, so it always traces
         # cmd = ["/bin/sh","-c","/parity-evm state-test --std-json /testfiles/%s 1>&2" % os.path.basename(test.filename)]
-        cmd = Fuzzer.shWrap(cmd, test.tempTraceFilename('parity'))
-        return self.execInDocker("parity", cmd)
+        return ["/parity-evm", "state-test", "--std-json", "/testfiles/%s" % os.path.basename(test.filename)]
+
+    def commands(self, test):
+        """ Returns a (client, container, command, trace file) per client, to execute the test with """
+        builders = {'geth': self.gethCommand,
+                    'cpp': self.cppCommand,
+                    'parity': self.parityCommand,
+                    'hera': self.heraCommand}
+        commands = []
+        for (client_name, x, y) in self._config.active_clients:
+            if client_name in builders:
+                cmd = builders[client_name](test)
+                if client_name in self._config.binaries:
+                    cmd = self.localCommand(client_name, test, cmd)
+                commands.append((client_name, self._config.containerName(client_name, test.replica),
+                                 cmd, test.tempTraceFilename(client_name)))
+            else:
+                logger.warning("Undefined client %s", client_name)
+        return commands
 
     def startHera(self, test):
-        cmd = ["/build/test/testeth",
-               "-t", "GeneralStateTests", "--",
-               "--vm", "hera",
-               "--evmc", "evm2wasm.js=true", "--evmc", "fallback=false",
-               "--singletest", "/testfiles/%s" % os.path.basename(test.tmpfile), test.name,
-               ]
-        return self.execInDocker("hera", cmd, stderr=False)
+        return self.execClient("hera", test, self.heraCommand(test), stderr=False)
+
+    def heraCommand(self, test):
+        return ["/build/test/testeth",
+                "-t", "GeneralStateTests", "--",
+                "--vm", "hera",
+                "--evmc", "evm2wasm.js=true", "--evmc", "fallback=false",
+                "--singletest", "/testfiles/%s" % os.path.basename(test.filename), test.name,
+                ]
 
     def startCpp(self, test):
+        return self.execClient("cpp", test, self.cppCommand(test), stderr=False)
+
+    def cppCommand(self, test):
         # docker exec -it cpp /usr/bin/testeth -t GeneralStateTests -- --singletest /testfiles/0001--randomStatetestmartin-Fri_09_42_57-7812-0-1-test.json randomStatetestmartin-Fri_09_42_57-7812-0   --jsontrace '{ "disableStorage" : false, "disableMemory" : false, "disableStack" : false, "fullStorage" : true }'
         # docker exec -it cpp /usr/bin/testeth -t GeneralStateTests -- --singletest /testfiles/0015--randomStatetestmartin-Fri_10_15_53-13070-3-3-test.json randomStatetestmartin-Fri_10_15_53-13070-3 --jsontrace '{"disableStack": false, "fullStorage": false, "disableStorage": false, "disableMemory": false}'
 
-        cmd = ["/usr/bin/testeth",
-               "-t", "GeneralStateTests", "--",
-               "--singletest", "/testfiles/%s" % os.path.basename(test.tmpfile), test.name,
-               "--jsontrace", "'%s'" % json.dumps(
-                {"disableStorage": True, "disableMemory": True, "disableStack": False, "fullStorage": False})
-               ]
-        return self.execInDocker("cpp", cmd, stderr=False)
+        level = VMUtils.fidelityLevel(test.fidelity)
+        return ["/usr/bin/testeth",
+                "-t", "GeneralStateTests", "--",
+                "--singletest", "/testfiles/%s" % os.path.basename(test.filename), test.name,
+                "--jsontrace", json.dumps(
+                    {"disableStorage": True, "disableMemory": not level.memory, "disableStack": not level.stack,
+                     "fullStorage": False})
+                ]
 
 
 def event_str(event):
@@ -885,6 +1934,14 @@ def configFuzzer():
 
     if args.benchmark:
         duration = 10
+        if fuzzer._config.generator_workers > 0:
+            logger.info("generator processes: %ssec duration" % duration)
+            rates = fuzzer.benchmark_generators(duration)
+            for (worker, rate) in enumerate(rates):
+                logger.info("generator %d: %f tests/s" % (worker, rate))
+            logger.info("%d generators: %f tests/s" % (len(rates), sum(rates)))
+            sys.exit(0)
+
         logger.info("running benchmark for new and old method")
         # benchmark old or new method?
 
@@ -930,7 +1987,8 @@ def main():
         return
 
     fuzzer.start_daemons()
-    TestExecutor(fuzzer=fuzzer).startFuzzing()
+    executor = AsyncTestExecutor if fuzzer._config.async_executor else TestExecutor
+    executor(fuzzer=fuzzer).startFuzzing()
 
 
 if __name__ == '__main__':
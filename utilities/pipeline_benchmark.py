@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmarks the stages of the fuzzer pipeline offline, without any clients: test generation,
+serialization, canonicalization per client, comparison and writing the artefacts.
+
+The client outputs are read from <fixtures>/<test>/<client>.trace.log (see trace_benchmark),
+files/fixtures/example has the traces of geth, parity, cpp and hera.
+The results are written as json, e.g.
+
+    python3 pipeline_benchmark.py -c statetests.ini -o results.json
+    python3 pipeline_benchmark.py -c statetests.ini --baseline results.json
+
+With a baseline, the stages which got slower than the tolerance are reported, and the exit
+code is 1.
+"""
+import os, sys, time, json, shutil, tempfile, platform, argparse
+import logging
+
+from evmlab import vm as VMUtils
+from evmlab import fastjson
+from fuzzer import Config, StateTest, RawStateTest, canonicalizers, process_traces, _statetest_template
+from trace_benchmark import FIXTURES, load_fixtures
+
+logger = logging.getLogger(__name__)
+
+
+def measure(func, rounds, setup=None):
+    """ Returns {mean, min} seconds of func over the rounds. If given, setup is called (untimed)
+    before each round, and its result is passed to func """
+    times = []
+    for _ in range(rounds):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {"mean": sum(times) / len(times), "min": min(times)}
+
+
+def bench_generation(config, rounds):
+    """ Times filling the template, and the encoding and writing of a filled test as the test
+    generators do it (see _generate_tests) """
+    template = _statetest_template(config)
+    generation = measure(template.fill, rounds)
+    counter = iter(range(rounds))
+
+    def fill():
+        i = next(counter)
+        name = StateTest.testname(config, i)
+        return (i, name, template.fill(name=name))
+
+    def serialize(filled):
+        (i, name, test_obj) = filled
+        s = StateTest(test_obj, i, config=config)
+        s.serialized = template._serialize(name, test_obj[name]).encode()
+        s.writeToFile()
+
+    return {"generation": generation, "serialization": measure(serialize, rounds, setup=fill)}
+
+
+def bench_traces(config, fixtures, rounds):
+    fidelity = config.trace_fidelity
+    canonicalization = {}
+    for ((test, client), fname) in fixtures.items():
+        def canonicalize():
+            with VMUtils.TraceFile(fname) as f:
+                for step in canonicalizers[client](f, fidelity=fidelity):
+                    pass
+        canonicalization.setdefault(client, {})[test] = measure(canonicalize, rounds)
+
+    comparison = {}
+    for test in sorted(set(test for (test, client) in fixtures)):
+        locations = [(client, fname) for ((t, client), fname) in sorted(fixtures.items()) if t == test]
+        if len(locations) > 1:
+            comparison[test] = measure(lambda: process_traces(locations, config.traceSettings, forceSave=True), rounds)
+    return {"canonicalization": canonicalization, "comparison": comparison}
+
+
+def bench_artefacts(config, fixtures, rounds):
+    """ Saves the traces of the first test, as the fuzzer does for a failing test """
+    test = sorted(set(test for (test, client) in fixtures))[0]
+    locations = [(client, fname) for ((t, client), fname) in sorted(fixtures.items()) if t == test]
+    result = process_traces(locations, config.traceSettings, forceSave=True)
+    counter = iter(range(rounds))
+    tests = []
+    for i in range(rounds):
+        t = RawStateTest({"randomStatetest%d" % i: {}}, "bench-%d" % i, "bench-%d.json" % i, config)
+        for (client, fname) in locations:
+            shutil.copy(fname, t.tempTraceLocation(client))
+            t.storeTrace(client, "")
+        tests.append(t)
+
+    def save():
+        t = tests[next(counter)]
+        t.saveArtefacts()
+        t.addArtefact("combined_trace.log", "\n".join(result.trace_output or []))
+
+    return {"artefacts": measure(save, rounds)}
+
+
+def compare(results, baseline, tolerance, path=()):
+    """ Returns the stages which are slower than tolerance times the baseline """
+    if "mean" in results:
+        if "mean" in baseline and results["mean"] > tolerance * baseline["mean"]:
+            return ["%s: %.3f ms, was %.3f ms" % ("/".join(path), results["mean"] * 1000, baseline["mean"] * 1000)]
+        return []
+    slower = []
+    for (key, value) in results.items():
+        if isinstance(value, dict) and key in baseline:
+            slower.extend(compare(value, baseline[key], tolerance, path + (key,)))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzzer pipeline benchmark')
+    parser.add_argument("-c", "--configfile", default="statetests.ini",
+                        help="path to configuration file (default: statetests.ini)")
+    parser.add_argument("-s", "--set-config", default=[], nargs='*', help="override settings in ini as <section>.<value>=<value>")
+    parser.add_argument("-f", "--fixtures", default=FIXTURES, help="path to the trace fixtures")
+    parser.add_argument("-r", "--rounds", default=20, type=int, help="rounds per measurement")
+    parser.add_argument("-o", "--output", default=None, help="write the results to this file (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="results to compare against")
+    parser.add_argument("--tolerance", default=1.2, type=float, help="slowdown relative to the baseline which is reported")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    config = Config(argparse.Namespace(configfile=args.configfile, set_config=args.set_config))
+    fixtures = load_fixtures(args.fixtures, list(canonicalizers))
+    if not fixtures:
+        print("No fixtures found in %s" % args.fixtures)
+        return 1
+
+    # The tests and artefacts are written to a temporary directory
+    tmp = tempfile.mkdtemp(prefix="evmlab-bench-")
+    config.artefacts = os.path.join(tmp, "artefacts")
+    config.exchange_path = tmp
+    for d in (config.artefacts, config.testfilesPath, config.logfilesPath):
+        os.makedirs(d, exist_ok=True)
+
+    results = {
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "json_backend": fastjson.backend,
+        "compare_backend": config.compare_backend,
+        "digest_checkpoint": config.digest_checkpoint,
+        "fidelity": config.trace_fidelity,
+        "rounds": args.rounds,
+    }
+    try:
+        results["stages"] = {}
+        results["stages"].update(bench_generation(config, args.rounds))
+        results["stages"].update(bench_traces(config, fixtures, args.rounds))
+        results["stages"].update(bench_artefacts(config, fixtures, args.rounds))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(results["stages"], baseline.get("stages", {}), args.tolerance)
+        for line in slower:
+            print("slower: %s" % line, file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Measures how the fuzzer scales with the number of container replicas per client.
+
+The configured clients execute generated tests for a while at each replica count,
+and the tests/s are reported per replica count. Run it on the host you fuzz on, e.g.
+
+    python3 replica_benchmark.py -c statetests.ini -r 1,2,4,8 -d 120
+
+"""
+import os, argparse
+import logging
+
+from fuzzer import Fuzzer, TestExecutor, AsyncTestExecutor, Config
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzzer scaling benchmark')
+    parser.add_argument("-c", "--configfile", default="statetests.ini",
+                        help="path to configuration file (default: statetests.ini)")
+    parser.add_argument("-s", "--set-config", default=[], nargs='*', help="override settings in ini as <section>.<value>=<value>")
+    parser.add_argument("-r", "--replicas", default="1,2,4,8", help="replica counts to measure")
+    parser.add_argument("-d", "--duration", default=60, type=int, help="seconds per replica count")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    config = Config(argparse.Namespace(configfile=args.configfile, set_config=args.set_config))
+    fuzzer = Fuzzer(config=config)
+
+    results = []
+    for replicas in [int(r) for r in args.replicas.split(",")]:
+        config.client_replicas = replicas
+        fuzzer.start_daemons()
+        try:
+            executor = (AsyncTestExecutor if config.async_executor else TestExecutor)(fuzzer)
+            executor.startFuzzing(duration=args.duration)
+            results.append((replicas, executor.numTotals(), executor.testsPerSecond()))
+        finally:
+            fuzzer.stop_daemons()
+        print("%3d replicas: %6d tests, %8.2f tests/s" % results[-1])
+
+    print("cpus: %d, clients: %s" % (os.cpu_count(), ",".join(config.clientNames)))
+    print("replicas      tests/s   speedup")
+    for (replicas, total, tps) in results:
+        print("%8d %12.2f %9.2f" % (replicas, tps, tps / results[0][2] if results[0][2] else 0))
+
+
+if __name__ == '__main__':
+    main()
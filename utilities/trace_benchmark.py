@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Benchmarks the decoding and canonicalization of recorded client traces.
+
+Traces are read from <fixtures>/<test>/<client>.trace.log, e.g.
+files/fixtures/example/geth.trace.log
+
+"""
+import os, time, argparse
+import logging
+
+from evmlab import vm as VMUtils
+from evmlab import fastjson
+
+logger = logging.getLogger(__name__)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files", "fixtures")
+
+canonicalizers = {
+    "geth": VMUtils.GethVM.canonicalized,
+    "parity": VMUtils.ParityVM.canonicalized,
+}
+
+
+def load_fixtures(path, clients):
+    """ Returns a dict of {(test, client): filename} """
+    fixtures = {}
+    for test in sorted(os.listdir(path)):
+        for client in clients:
+            fname = os.path.join(path, test, "%s.trace.log" % client)
+            if os.path.exists(fname):
+                fixtures[(test, client)] = fname
+    return fixtures
+
+
+def canonicalize_file(canon, fname, reader):
+    with reader(fname) as f:
+        return list(canon(f))
+
+
+def timeit(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds
+
+
+def bench(fname, client, rounds):
+    """ Returns a dict of {measurement: seconds per trace} for the active backend """
+    canon = canonicalizers[client]
+    with open(fname) as f:
+        lines = [l for l in f.read().split("\n") if l]
+    return {
+        "decode": timeit(lambda: [fastjson.loads(l) for l in lines], rounds),
+        "canonicalize": timeit(lambda: list(canon(lines)), rounds),
+        "file(text)": timeit(lambda: canonicalize_file(canon, fname, open), rounds),
+        "file(mmap)": timeit(lambda: canonicalize_file(canon, fname, VMUtils.TraceFile), rounds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trace decoding benchmark')
+    parser.add_argument("-f", "--fixtures", default=FIXTURES, help="path to the trace fixtures")
+    parser.add_argument("-c", "--clients", default="geth,parity", help="clients to benchmark")
+    parser.add_argument("-r", "--rounds", default=20, type=int, help="rounds per measurement")
+    parser.add_argument("-b", "--backends", default=",".join(fastjson.backends),
+                        help="json backends to compare (default: all available)")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures, args.clients.split(","))
+    if not fixtures:
+        print("No fixtures found in %s" % args.fixtures)
+        return
+
+    default = fastjson.backend
+    try:
+        for name in args.backends.split(","):
+            try:
+                fastjson.use(name)
+            except ImportError:
+                print("%-8s not available" % name)
+                continue
+            for ((test, client), fname) in fixtures.items():
+                res = bench(fname, client, args.rounds)
+                print("%-8s %-10s %-20s " % (name, client, test) +
+                      "  ".join("%s %8.2f ms" % (k, v * 1000) for (k, v) in res.items()))
+    finally:
+        fastjson.use(default)
+
+
+if __name__ == '__main__':
+    main()